@@ -1,609 +1,3272 @@
-import streamlit as st
-import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime, timedelta
-import urllib3
-import FinanceDataReader as fdr
-import time
-import re
-import webbrowser
-
-# SSL 경고 무시
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-# --- 데이터 수집 함수들 ---
-@st.cache_data(ttl=3600)
-def load_stock_data():
-    try:
-        df = fdr.StockListing('KRX')
-        if not df.empty:
-            df['Search_Key'] = df['Name'] + " (" + df['Code'] + ")"
-            search_map = dict(zip(df['Search_Key'], df['Code']))
-            ticker_to_name = dict(zip(df['Code'], df['Name']))
-            search_list = list(search_map.keys())
-            return search_list, search_map, ticker_to_name
-    except:
-        pass
-    return [], {}, {}
-
-def get_naver_stock_details(ticker):
-    try:
-        url = f"https://finance.naver.com/item/main.naver?code={ticker}"
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers, verify=False, timeout=10)
-        
-        data = {
-            'name': ticker, 'overview': "정보 없음", 
-            'now_price': '0', 'diff_rate': '0.00', 'diff_amount': '0', 'direction': 'flat',
-            'market_cap': '-', 'shares': 0, 'foreign_rate': '-', 
-            'per': '-', 'eps': '-', 'pbr': '-', 'bps': '-', 'dvr': '-',
-            'high_52': '-', 'low_52': '-'
-        }
-        
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            name_tag = soup.select_one(".wrap_company h2 a")
-            if name_tag: data['name'] = name_tag.text.strip()
-
-            overview_div = soup.select_one("#summary_info")
-            if overview_div:
-                data['overview'] = "\n ".join([p.text.strip() for p in overview_div.select("p") if p.text.strip()])
-
-            try:
-                now_tag = soup.select_one(".no_today .blind")
-                if now_tag: data['now_price'] = now_tag.text.strip()
-                
-                exday_tag = soup.select_one(".no_exday")
-                if exday_tag:
-                    spans = exday_tag.select("span.blind")
-                    if len(spans) >= 2:
-                        data['diff_amount'] = spans[0].text.strip()
-                        data['diff_rate'] = spans[1].text.strip()
-                    
-                    if exday_tag.select_one(".ico.up"): data['direction'] = 'up'
-                    elif exday_tag.select_one(".ico.down"): data['direction'] = 'down'
-                    elif exday_tag.select_one(".ico.upper"): data['direction'] = 'upper'
-                    elif exday_tag.select_one(".ico.lower"): data['direction'] = 'lower'
-            except: pass
-
-            try:
-                mc_element = soup.select_one("#_market_sum")
-                if mc_element:
-                    data['market_cap'] = mc_element.text.strip().replace('\t', '').replace('\n', '') + " 억원"
-            except: pass
-
-            try:
-                first_table = soup.select_one("div.first table")
-                if first_table:
-                    for tr in first_table.select("tr"):
-                        if "상장주식수" in tr.text:
-                            em = tr.select_one("em")
-                            if em:
-                                shares_str = em.text.strip().replace(',', '')
-                                data['shares'] = int(shares_str)
-                            break
-            except: pass
-
-            try:
-                per_el = soup.select_one("#_per")
-                if per_el: data['per'] = per_el.text.strip()
-                eps_el = soup.select_one("#_eps")
-                if eps_el: data['eps'] = eps_el.text.strip()
-                pbr_el = soup.select_one("#_pbr")
-                if pbr_el: data['pbr'] = pbr_el.text.strip()
-                dvr_el = soup.select_one("#_dvr")
-                if dvr_el: data['dvr'] = dvr_el.text.strip()
-            except: pass
-
-            all_ths = soup.select("th")
-            for th in all_ths:
-                th_text = th.text.strip()
-                if "외국인소진율" in th_text:
-                    td = th.find_next_sibling("td")
-                    if td:
-                        em = td.select_one("em")
-                        data['foreign_rate'] = em.text.strip() if em else td.text.strip()
-                elif "52주최고" in th_text:
-                    td = th.find_next_sibling("td")
-                    if td:
-                        ems = td.select("em")
-                        if len(ems) >= 2:
-                            data['high_52'] = ems[0].text.strip()
-                            data['low_52'] = ems[1].text.strip()
-                elif "BPS" in th_text and "PBR" not in th_text:
-                    td = th.find_next_sibling("td")
-                    if td:
-                        em = td.select_one("em")
-                        data['bps'] = em.text.strip() if em else td.text.strip()
-            
-            if data['bps'] == '-':
-                try:
-                    per_table = soup.select_one("table.per_table")
-                    if per_table:
-                        rows = per_table.select("tr")
-                        for r in rows:
-                            if "BPS" in r.text:
-                                ems = r.select("em")
-                                if len(ems) >= 2: data['bps'] = ems[1].text.strip()
-                                elif len(ems) == 1: data['bps'] = ems[0].text.strip()
-                except: pass
-
-        return data
-    except:
-        return {'name': ticker, 'overview': "로딩 실패", 'shares': 0}
-
-def get_investor_trend(ticker):
-    try:
-        url = f"https://finance.naver.com/item/frgn.naver?code={ticker}"
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers, verify=False)
-        trends = []
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            tables = soup.select("table.type2")
-            if len(tables) >= 2:
-                target_table = tables[1]
-                rows = target_table.select("tr")
-                for row in rows:
-                    cols = row.select("td")
-                    if len(cols) == 9:
-                        date = cols[0].text.strip()
-                        close = cols[1].text.strip()
-                        rate = cols[3].text.strip().replace('\n', '').replace('\t', '')
-                        inst_net = cols[5].text.strip()
-                        frgn_net = cols[6].text.strip()
-                        hold_rate = cols[8].text.strip()
-                        trends.append({"날짜": date, "종가": close, "등락률": rate, "기관": inst_net, "외국인": frgn_net, "보유율": hold_rate})
-                        if len(trends) >= 10: break
-        return trends
-    except:
-        return []
-
-def get_same_industry_comparison(ticker):
-    try:
-        url = f"https://finance.naver.com/item/main.naver?code={ticker}"
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers, verify=False)
-        
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            compare_section = soup.select_one("div.section.trade_compare")
-            if compare_section:
-                table = compare_section.select_one("table")
-                if table:
-                    headers = ["구분"]
-                    thead = table.select_one("thead")
-                    for th in thead.select("th"):
-                        if th.find("a"):
-                            raw_header = th.text.strip()
-                            clean_header = raw_header.split('*')[0].strip()
-                            headers.append(clean_header)
-                    
-                    rows_data = []
-                    tbody = table.select_one("tbody")
-                    for tr in tbody.select("tr"):
-                        row_val = []
-                        th_item = tr.select_one("th")
-                        row_title = ""
-                        if th_item:
-                            row_title = th_item.text.strip()
-                            row_val.append(row_title)
-                        
-                        for td in tr.select("td"):
-                            raw_text = td.text.strip()
-                            clean_text = re.sub(r'[\n\t]+', ' ', raw_text)
-                            clean_text = re.sub(r'\s+', ' ', clean_text).strip()
-                            
-                            if row_title in ["전일대비", "등락률"]:
-                                val_text = re.sub(r'[^0-9.,%]', '', clean_text)
-                                if "상향" in clean_text or "상승" in clean_text or "+" in clean_text:
-                                    clean_text = f'<span style="color:#d20000">+{val_text}</span>'
-                                elif "하향" in clean_text or "하락" in clean_text or "-" in clean_text:
-                                    clean_text = f'<span style="color:#0051c7">-{val_text}</span>'
-                                elif "보합" in clean_text:
-                                    clean_text = val_text
-                            
-                            row_val.append(clean_text)
-                        
-                        if len(row_val) == len(headers):
-                             rows_data.append(row_val)
-                        elif len(row_val) > len(headers):
-                             rows_data.append(row_val[:len(headers)])
-
-                    return pd.DataFrame(rows_data, columns=headers)
-        return pd.DataFrame()
-    except:
-        return pd.DataFrame()
-
-def clean_float(text):
-    if not text or text.strip() in ['-', 'N/A', '', '.']:
-        return 0.0
-    try:
-        text = text.replace(',', '')
-        match = re.search(r'-?\d+\.?\d*', text)
-        if match:
-            return float(match.group())
-        return 0.0
-    except:
-        return 0.0
-
-def get_financials_from_naver(ticker, current_price=0, shares=0):
-    try:
-        url = f"https://finance.naver.com/item/main.naver?code={ticker}"
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers, verify=False)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        finance_table = soup.select_one("div.section.cop_analysis > div.sub_section > table")
-        if not finance_table: return [], []
-
-        header_rows = finance_table.select("thead > tr")
-        date_cols = [th.text.strip() for th in header_rows[1].select("th")]
-        
-        annual_idxs = []
-        quarter_idxs = []
-        
-        for i, col in enumerate(date_cols):
-             if i < 4 and "(E)" not in col: annual_idxs.append(i)
-             elif i >= 4 and "(E)" not in col: quarter_idxs.append(i)
-        
-        annual_idxs = annual_idxs[-3:]
-        quarter_idxs = quarter_idxs[-5:]
-
-        annual_data = [{'date': date_cols[i].split('(')[0]} for i in annual_idxs]
-        quarter_data = [{'date': date_cols[i].split('(')[0]} for i in quarter_idxs]
-
-        rows = finance_table.select("tbody > tr")
-        items_map_main = {
-            "매출액": "revenue", "영업이익": "op_income", "당기순이익": "net_income",
-            "영업이익률": "op_margin", "순이익률": "net_income_margin", "ROE": "roe",
-            "부채비율": "debt_ratio", "당좌비율": "quick_ratio", "유보율": "reserve_ratio",
-            "EPS": "eps", "BPS": "bps", "PER": "per", "PBR": "pbr",
-            "주당배당금": "dps", "배당성향": "payout_ratio", "시가배당률": "dividend_yield",
-        }
-
-        def fill_data(target_list, indices):
-            for i, idx in enumerate(indices):
-                for row in rows:
-                    th_text = row.th.text.strip().replace(" ", "")
-                    key = None
-                    for k_txt, k_key in items_map_main.items():
-                        if k_txt in th_text:
-                             if k_txt == "영업이익" and "률" in th_text: continue
-                             if k_txt == "당기순이익" and "률" in th_text: continue
-                             key = k_key
-                             break
-
-                    if key:
-                        cells = row.select("td")
-                        cell_offset = len(date_cols) - len(cells)
-                        t_idx = idx - cell_offset
-                        if 0 <= t_idx < len(cells):
-                            target_list[i][key] = clean_float(cells[t_idx].text.strip())
-                
-                rev = target_list[i].get('revenue', 0)
-                if rev and shares > 0:
-                     sps = (rev * 100000000) / shares
-                     target_list[i]['sps'] = sps
-                     if current_price > 0: target_list[i]['psr'] = current_price / sps
-        
-        fill_data(annual_data, annual_idxs)
-        fill_data(quarter_data, quarter_idxs)
-        
-        return annual_data, quarter_data
-
-    except:
-        return [], []
-
-def calculate_srim(bps, roe, rrr):
-    if rrr <= 0: return 0
-    excess_profit_rate = (roe - rrr) / 100
-    fair_value = bps + (bps * excess_profit_rate / (rrr / 100))
-    return fair_value
-
-if 'search_key' not in st.session_state:
-    st.session_state.search_key = 0 
-
-def reset_search_state():
-    st.session_state.search_key += 1 
-
-# --- 메인 UI ---
-def main():
-    st.set_page_config(page_title="주식 적정주가 분석기", page_icon="📈")
-    
-    if 'search_list' not in st.session_state:
-        with st.spinner('종목 데이터 로딩 중...'):
-            st.session_state.search_list, st.session_state.search_map, st.session_state.ticker_to_name = load_stock_data()
-    
-    search_list = st.session_state.search_list
-    search_map = st.session_state.search_map
-    ticker_to_name = st.session_state.ticker_to_name
-
-    with st.sidebar:
-        st.header("설정")
-        required_return = st.number_input("요구수익률 (%)", 1.0, 20.0, 8.0, 0.5)
-
-    st.markdown("##### 종목 검색")
-    col_search, col_reset = st.columns([4, 1])
-    
-    ticker = None
-    with col_search:
-        if search_list:
-            stock_input = st.selectbox(
-                "종목을 선택하거나 입력하세요", 
-                [""] + search_list,
-                index=0,
-                key=f"stock_selectbox_{st.session_state.search_key}",
-                label_visibility="collapsed",
-                placeholder="종목명 또는 코드를 입력하세요..."
-            )
-            if stock_input:
-                ticker = search_map.get(stock_input)
-        else:
-            ticker_input = st.text_input("종목코드(6자리) 직접 입력")
-            if ticker_input and len(ticker_input) == 6 and ticker_input.isdigit():
-                ticker = ticker_input
-    
-    with col_reset:
-        if st.button("🔄 초기화"):
-            reset_search_state()
-            st.cache_data.clear()
-            st.rerun()
-
-    if ticker:
-        try:
-            info = get_naver_stock_details(ticker)
-            try: curr_price = float(info['now_price'].replace(',', ''))
-            except: curr_price = 0
-            
-            annual_list, quarter_list = get_financials_from_naver(ticker, curr_price, info.get('shares', 0))
-            investor_trends = get_investor_trend(ticker)
-            industry_compare_df = get_same_industry_comparison(ticker)
-            
-            st.markdown(f"### {info['name']} ({ticker})")
-            
-            diff_color = "black"
-            diff_arrow = ""
-            if info['direction'] in ['up', 'upper']:
-                diff_color = "#d20000"
-                diff_arrow = "▲"
-            elif info['direction'] in ['down', 'lower']:
-                diff_color = "#0051c7"
-                diff_arrow = "▼"
-            
-            st.markdown(f"""
-            <div style="display:flex; align-items:flex-end; gap:10px; margin-bottom:10px;">
-                <span style="font-size: 2.5rem; font-weight: bold; color:{diff_color};">{info['now_price']}</span>
-                <span style="font-size: 1.2rem; color:{diff_color}; margin-bottom: 8px;">
-                    {diff_arrow} {info['diff_amount']} ({info['diff_rate']}%)
-                </span>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown("""
-            <style>
-            .stock-info-container { display: grid; grid-template-columns: repeat(4, 1fr); gap: 8px; margin-top: 10px; margin-bottom: 20px; }
-            @media (max-width: 600px) { .stock-info-container { grid-template-columns: repeat(2, 1fr); } }
-            .stock-info-box { background-color: rgba(128, 128, 128, 0.1); padding: 10px; border-radius: 5px; text-align: center; }
-            .stock-info-label { font-size: 12px; color: #666; margin-bottom: 4px; }
-            .stock-info-value { font-size: 15px; font-weight: bold; color: #333; white-space: nowrap; }
-            @media (prefers-color-scheme: dark) { .stock-info-label { color: #aaa; } .stock-info-value { color: #fff; } }
-            </style>
-            """, unsafe_allow_html=True)
-
-            info_html = f"""
-            <div class="stock-info-container">
-                <div class="stock-info-box"><div class="stock-info-label">시가총액</div><div class="stock-info-value">{info['market_cap']}</div></div>
-                <div class="stock-info-box"><div class="stock-info-label">외국인소진율</div><div class="stock-info-value">{info['foreign_rate']}</div></div>
-                <div class="stock-info-box"><div class="stock-info-label">PER</div><div class="stock-info-value">{info['per']} 배</div></div>
-                <div class="stock-info-box"><div class="stock-info-label">PBR</div><div class="stock-info-value">{info['pbr']} 배</div></div>
-                <div class="stock-info-box"><div class="stock-info-label">52주 최고</div><div class="stock-info-value">{info['high_52']}</div></div>
-                <div class="stock-info-box"><div class="stock-info-label">52주 최저</div><div class="stock-info-value">{info['low_52']}</div></div>
-                <div class="stock-info-box"><div class="stock-info-label">EPS</div><div class="stock-info-value">{info['eps']} 원</div></div>
-                <div class="stock-info-box"><div class="stock-info-label">배당수익률</div><div class="stock-info-value">{info['dvr']} %</div></div>
-            </div>
-            """
-            st.markdown(info_html, unsafe_allow_html=True)
-
-            with st.expander("기업 개요 보기"):
-                st.write(info['overview'])
-
-            st.markdown(f"""
-                <a href="https://m.stock.naver.com/item/main.nhn?code={ticker}#/chart" target="_blank" style="text-decoration:none;">
-                    <div style="background-color:#03C75A; color:white; padding:12px; border-radius:8px; text-align:center; font-weight:bold; margin: 15px 0;">
-                        📊 네이버 증권 차트 보러가기
-                    </div>
-                </a>
-                """, unsafe_allow_html=True)
-            
-            t_stamp = int(time.time())
-            tab_d, tab_w, tab_m = st.tabs(["일봉", "주봉", "월봉"])
-            with tab_d: st.image(f"https://ssl.pstatic.net/imgfinance/chart/item/candle/day/{ticker}.png?t={t_stamp}", use_container_width=True)
-            with tab_w: st.image(f"https://ssl.pstatic.net/imgfinance/chart/item/candle/week/{ticker}.png?t={t_stamp}", use_container_width=True)
-            with tab_m: st.image(f"https://ssl.pstatic.net/imgfinance/chart/item/candle/month/{ticker}.png?t={t_stamp}", use_container_width=True)
-
-            if investor_trends:
-                st.markdown("### 🏢 외국인/기관 매매동향 (최근 10일)")
-                total_inst = 0
-                total_frgn = 0
-                for row in investor_trends:
-                    try: total_inst += int(row['기관'].replace('+', '').replace(',', ''))
-                    except: pass
-                    try: total_frgn += int(row['외국인'].replace('+', '').replace(',', ''))
-                    except: pass
-                
-                t_inst_color = "text-red" if total_inst > 0 else "text-blue" if total_inst < 0 else "text-black"
-                t_inst_prefix = "+" if total_inst > 0 else "-" if total_inst < 0 else ""
-                t_frgn_color = "text-red" if total_frgn > 0 else "text-blue" if total_frgn < 0 else "text-black"
-                t_frgn_prefix = "+" if total_frgn > 0 else "-" if total_frgn < 0 else ""
-
-                trend_html = """<style>
-.trend-table { width: 100%; border-collapse: collapse; font-size: 0.85rem; margin-bottom: 20px; }
-.trend-table th { background-color: rgba(128,128,128,0.1); text-align: center; padding: 6px; border-bottom: 1px solid rgba(128,128,128,0.2); }
-.trend-table td { text-align: right; padding: 6px; border-bottom: 1px solid rgba(128,128,128,0.2); }
-.total-row { background-color: rgba(128, 128, 128, 0.05); font-weight: bold; border-bottom: 2px solid rgba(128, 128, 128, 0.4); }
-.text-red { color: #d20000; }
-.text-blue { color: #0051c7; }
-.text-black { color: inherit; }
-@media (prefers-color-scheme: dark) { .text-black { color: #fff; } }
-</style>
-<div style="overflow-x:auto;">
-<table class="trend-table">
-<thead><tr><th>날짜</th><th>종가</th><th>등락률</th><th>기관</th><th>외국인</th><th>보유율</th></tr></thead>
-<tbody>
-"""
-                trend_html += f"""<tr class="total-row"><td style="text-align:center;">10일 합계</td><td colspan="2" style="text-align:center;">-</td><td class="{t_inst_color}">{t_inst_prefix}{abs(total_inst):,}</td><td class="{t_frgn_color}">{t_frgn_prefix}{abs(total_frgn):,}</td><td>-</td></tr>"""
-
-                for row in investor_trends:
-                    inst_val_str = row['기관'].replace('+', '').replace(',', '')
-                    try: inst_val = int(inst_val_str)
-                    except: inst_val = 0
-                    inst_color = "text-red" if inst_val > 0 else "text-blue" if inst_val < 0 else "text-black"
-                    inst_prefix = "+" if inst_val > 0 else "-" if inst_val < 0 else ""
-                    
-                    frgn_val_str = row['외국인'].replace('+', '').replace(',', '')
-                    try: frgn_val = int(frgn_val_str)
-                    except: frgn_val = 0
-                    frgn_color = "text-red" if frgn_val > 0 else "text-blue" if frgn_val < 0 else "text-black"
-                    frgn_prefix = "+" if frgn_val > 0 else "-" if frgn_val < 0 else ""
-                    
-                    try: rate_val = float(row['등락률'].replace('%', ''))
-                    except: rate_val = 0.0
-                    rate_color = "text-red" if rate_val > 0 else "text-blue" if rate_val < 0 else "text-black"
-
-                    trend_html += f'<tr><td style="text-align:center;">{row["날짜"]}</td><td style="text-align:right;">{row["종가"]}</td><td class="{rate_color}" style="text-align:right;">{row["등락률"]}</td><td class="{inst_color}" style="text-align:right;">{inst_prefix}{abs(inst_val):,}</td><td class="{frgn_color}" style="text-align:right;">{frgn_prefix}{abs(frgn_val):,}</td><td style="text-align:right;">{row["보유율"]}</td></tr>'
-                
-                trend_html += "</tbody></table></div>"
-                st.markdown(trend_html, unsafe_allow_html=True)
-
-            st.markdown("""
-            <style>
-            .scroll-table { overflow-x: auto; white-space: nowrap; margin-bottom: 10px; }
-            .scroll-table table { width: 100%; border-collapse: collapse; font-size: 0.9rem; }
-            .scroll-table th { text-align: center; padding: 8px; border-bottom: 1px solid #ddd; min-width: 80px; background-color: #f0f2f6; color: #000; }
-            .scroll-table td { text-align: right; padding: 8px; border-bottom: 1px solid #ddd; }
-            .scroll-table th:first-child, .scroll-table td:first-child { position: sticky; left: 0; z-index: 10; border-right: 2px solid #ccc; text-align: left; font-weight: bold; background-color: #ffffff; color: #000000; }
-            @media (prefers-color-scheme: dark) {
-                .scroll-table th { background-color: #262730; color: #fff; border-bottom: 1px solid #444; }
-                .scroll-table td { border-bottom: 1px solid #444; color: #fff; }
-                .scroll-table th:first-child, .scroll-table td:first-child { background-color: #0e1117; color: #fff; border-right: 2px solid #555; }
-            }
-            </style>
-            """, unsafe_allow_html=True)
-
-            items_display = [
-                ("매출액(억)", 'revenue'), ("영업이익(억)", 'op_income'), ("영업이익률(%)", 'op_margin'),
-                ("당기순이익(억)", 'net_income'), ("순이익률(%)", 'net_income_margin'),
-                ("부채비율(%)", 'debt_ratio'), ("당좌비율(%)", 'quick_ratio'), ("유보율(%)", 'reserve_ratio'),
-                ("EPS(원)", 'eps'), ("BPS(원)", 'bps'), ("SPS(원)", 'sps'),
-                ("PER(배)", 'per'), ("PBR(배)", 'pbr'), ("PSR(배)", 'psr'),
-                ("ROE(%)", 'roe')
-            ]
-
-            if annual_list:
-                st.markdown("### 📊 연간 재무제표 (최근 3년)")
-                disp_annual = []
-                cols_annual = ['항목'] + [d['date'] for d in annual_list]
-                for label, key in items_display:
-                    row = [label]
-                    is_money = '원' in label or '억' in label
-                    for d in annual_list:
-                        val = d.get(key, 0)
-                        if val == 0 and key not in ['op_income', 'net_income']: row.append("-")
-                        else: row.append(f"{val:,.0f}" if is_money else f"{val:,.2f}")
-                    disp_annual.append(row)
-                df_annual = pd.DataFrame(disp_annual, columns=cols_annual)
-                html_annual = df_annual.to_html(index=False, border=0, classes='scroll-table-content')
-                st.markdown(f'<div class="scroll-table">{html_annual}</div>', unsafe_allow_html=True)
-
-            if quarter_list:
-                st.markdown("### 📊 분기 재무제표 (최근 5분기)")
-                disp_quarter = []
-                cols_quarter = ['항목'] + [d['date'] for d in quarter_list]
-                for label, key in items_display:
-                    row = [label]
-                    is_money = '원' in label or '억' in label
-                    for d in quarter_list:
-                        val = d.get(key, 0)
-                        if val == 0 and key not in ['op_income', 'net_income']: row.append("-")
-                        else: row.append(f"{val:,.0f}" if is_money else f"{val:,.2f}")
-                    disp_quarter.append(row)
-                df_quarter = pd.DataFrame(disp_quarter, columns=cols_quarter)
-                html_quarter = df_quarter.to_html(index=False, border=0, classes='scroll-table-content')
-                st.markdown(f'<div class="scroll-table">{html_quarter}</div>', unsafe_allow_html=True)
-
-            if not annual_list and not quarter_list:
-                st.warning("재무 데이터를 불러올 수 없습니다.")
-
-            if not industry_compare_df.empty:
-                st.markdown("### 👯 동일업종 비교")
-                html_compare = industry_compare_df.to_html(index=False, border=0, classes='scroll-table-content', escape=False)
-                st.markdown(f'<div class="scroll-table">{html_compare}</div>', unsafe_allow_html=True)
-
-            st.divider()
-            st.markdown("### 💰 S-RIM 적정주가 분석")
-
-            def show_srim_result(title, bps, roe_used, label_roe, roe_list=None):
-                val = calculate_srim(bps, roe_used, required_return)
-                excess_rate = roe_used - required_return
-                
-                st.markdown(f"#### {title}")
-                if val > 0 and curr_price > 0:
-                    diff_rate = (curr_price - val) / val * 100
-                    diff_abs = abs(diff_rate)
-                    if val > curr_price:
-                        st.success(f"현재가({curr_price:,.0f}원)는 적정주가({val:,.0f}원) 대비 **{diff_abs:.1f}% 저평가** 상태입니다.")
-                    else:
-                        st.error(f"현재가({curr_price:,.0f}원)는 적정주가({val:,.0f}원) 대비 **{diff_abs:.1f}% 고평가** 상태입니다.")
-                else:
-                    st.warning("적정주가를 산출할 수 없습니다.")
-
-                st.markdown("**🧮 산출 근거**")
-                c1, c2 = st.columns(2)
-                with c1:
-                    st.markdown("*핵심 변수*")
-                    input_df = pd.DataFrame({"구분": ["BPS", f"적용 ROE ({label_roe})"], "값": [f"{bps:,.0f} 원", f"{roe_used:.2f} %"]})
-                    st.table(input_df)
-                with c2:
-                    st.markdown("*ROE 내역*")
-                    if roe_list:
-                        roe_df = pd.DataFrame(roe_list)
-                        roe_df['ROE'] = roe_df['ROE'].apply(lambda x: f"{x:.2f} %")
-                        st.table(roe_df)
-                    else:
-                        st.write(f"적용 ROE: {roe_used:.2f}%")
-
-                with st.info("계산식"):
-                    st.markdown(f"**① 초과이익률** = {roe_used:.2f}% (ROE) - {required_return}% (요구수익률) = **{excess_rate:.2f}%**")
-                    st.markdown(f"**② 적정주가** = {bps:,.0f} (BPS) + ( {bps:,.0f} × {excess_rate:.2f}% ÷ {required_return}% ) ≈ **{val:,.0f} 원**")
-
-            if annual_list:
-                bps_annual = annual_list[-1].get('bps', 0)
-                roe_history_annual = []
-                for d in annual_list:
-                    if d.get('roe'): roe_history_annual.append({'연도': d['date'], 'ROE': d['roe']})
-                
-                roe_history_annual_3yr = roe_history_annual[-3:]
-                avg_roe_annual = sum([r['ROE'] for r in roe_history_annual_3yr]) / len(roe_history_annual_3yr) if roe_history_annual_3yr else 0
-                
-                show_srim_result("1. 최근 3년 실적 평균 기준 (연간)", bps_annual, avg_roe_annual, "3년 평균", roe_history_annual_3yr)
-            
-            st.divider()
-
-            if quarter_list:
-                bps_quarter = quarter_list[-1].get('bps', 0)
-                roe_history_quarter = []
-                for d in quarter_list:
-                    if d.get('roe'): roe_history_quarter.append({'분기': d['date'], 'ROE': d['roe']})
-                
-                roe_history_quarter_3q = roe_history_quarter[-3:]
-                avg_roe_quarter = sum([r['ROE'] for r in roe_history_quarter_3q]) / len(roe_history_quarter_3q) if roe_history_quarter_3q else 0
-                
-                show_srim_result("2. 최근 3분기 실적 평균 기준 (분기)", bps_quarter, avg_roe_quarter, "3분기 평균", roe_history_quarter_3q)
-
-        except Exception as e:
-            st.error(f"오류 발생: {e}")
-
-if __name__ == "__main__":
-    main()
+import streamlit as st
+import pandas as pd
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+from datetime import datetime, timedelta, timezone
+import urllib3
+import FinanceDataReader as fdr
+import altair as alt
+import time
+import re
+import webbrowser
+import threading
+import random
+import os
+import sys
+import sqlite3
+import argparse
+import statistics
+import json
+import csv
+import tracemalloc
+import logging
+import contextvars
+import difflib
+from pathlib import Path
+from urllib.parse import urlsplit
+from collections import OrderedDict, Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, TimeoutError as FuturesTimeout
+
+try:
+    import lxml.html as lxml_html
+    from lxml import etree
+except ImportError:
+    lxml_html = None
+
+try:
+    from pykrx import stock as krx
+except ImportError:
+    krx = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+# SSL 경고 무시
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# 로컬 데이터(저장소, 녹화된 응답) 위치
+DATA_DIR = Path(os.environ.get("STOCK_APP_DATA_DIR", Path(__file__).resolve().parent / "data"))
+
+# 외부 요청 방식. live: 실제 요청, record: 실제 요청 + 응답 녹화, replay: 녹화된 응답만 사용(네트워크 없음)
+def http_mode():
+    return os.environ.get("STOCK_APP_HTTP_MODE", "live")
+
+def fixture_dir():
+    return Path(os.environ.get("STOCK_APP_FIXTURE_DIR", DATA_DIR / "fixtures"))
+
+# --- 계측 ---
+# 화면 한 번 그릴 때의 구간(span)과 카운터를 모은다. 작업 스레드로는 contextvars 로 전달한다.
+logger = logging.getLogger("stock_app")
+TRACE_LOG_ENV = "STOCK_APP_TRACE_LOG"  # 지정하면 화면마다 JSON 한 줄씩 기록
+TRACE_HISTORY = 500                    # 프로세스 전체 p50/p95 집계에 쓰는 최근 기록 수
+
+_current_trace = contextvars.ContextVar("stock_app_trace", default=None)
+_current_section = contextvars.ContextVar("stock_app_section", default="-")
+
+class RenderTrace:
+    """한 번의 화면 렌더링 동안의 구간 기록 (스레드 안전)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self.spans = []
+        self.counters = Counter()
+        self.total = None
+        self._lock = threading.Lock()
+
+    def add_span(self, section, stage, start, end, error=None):
+        with self._lock:
+            self.spans.append({'section': section, 'stage': stage, 'start': start - self._origin,
+                               'duration': end - start, 'error': error})
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def finish(self):
+        self.total = time.perf_counter() - self._origin
+        return self
+
+    def to_dict(self):
+        with self._lock:
+            return {'name': self.name, 'started_at': self.started_at, 'total': self.total,
+                    'spans': list(self.spans), 'counters': dict(self.counters)}
+
+@contextmanager
+def span(stage, section=None):
+    """fetch / parse / extract / render 구간 측정. 트레이스가 없으면 아무것도 하지 않는다."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    section = section or _current_section.get()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        trace.add_span(section, stage, start, time.perf_counter(), error=repr(e))
+        trace.incr('failures')
+        raise
+    trace.add_span(section, stage, start, time.perf_counter())
+
+def count(name, n=1):
+    trace = _current_trace.get()
+    if trace is not None: trace.incr(name, n)
+
+def note_failure(where):
+    """삼켜지는 예외를 기록한다. except 블록 안에서 호출한다."""
+    logger.debug("scrape failure at %s", where, exc_info=True)
+    count('failures')
+    count(f'failure.{where}')
+
+def run_in_section(section, func, *args):
+    """작업 스레드에서 섹션 이름을 붙여 실행 (copy_context().run 과 함께 쓴다)"""
+    _current_section.set(section)
+    return func(*args)
+
+class TraceAggregator:
+    """최근 렌더링 기록을 모아 구간별 p50/p95 를 내고, 설정 시 JSON lines 로 내보낸다."""
+
+    def __init__(self, maxlen=TRACE_HISTORY, log_path=None):
+        self._traces = deque(maxlen=maxlen)
+        self.log_path = Path(log_path) if log_path else None
+        self._lock = threading.Lock()
+
+    def add(self, trace):
+        record = trace.to_dict()
+        with self._lock:
+            self._traces.append(record)
+            if self.log_path:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def summary(self):
+        with self._lock:
+            traces = list(self._traces)
+        durations = {}
+        for t in traces:
+            durations.setdefault(('전체', 'total'), []).append(t['total'] or 0)
+            for sp in t['spans']:
+                durations.setdefault((sp['section'], sp['stage']), []).append(sp['duration'])
+        rows = [{'섹션': sec, '구간': stage, '건수': len(v),
+                 'p50(ms)': round(float(np.percentile(v, 50)) * 1000, 1), 'p95(ms)': round(float(np.percentile(v, 95)) * 1000, 1)}
+                for (sec, stage), v in durations.items()]
+        return pd.DataFrame(rows)
+
+@st.cache_resource
+def get_trace_aggregator():
+    return TraceAggregator(TRACE_HISTORY, os.environ.get(TRACE_LOG_ENV))
+
+# --- 데이터 수집 함수들 ---
+def fetch_stock_listing():
+    """fdr.StockListing('KRX'). 녹화/재생 모드에서는 fixtures/listing/KRX.csv 를 쓴다. 실패하면 빈 DataFrame."""
+    listing_path = fixture_dir() / "listing" / "KRX.csv"
+    if http_mode() == "replay":
+        return pd.read_csv(listing_path, dtype={'Code': str}) if listing_path.exists() else pd.DataFrame()
+    try:
+        df = fdr.StockListing('KRX')
+        if not df.empty:
+            if http_mode() == "record":
+                listing_path.parent.mkdir(parents=True, exist_ok=True)
+                df.to_csv(listing_path, index=False)
+            return df
+    except Exception:
+        note_failure('listing')
+    return pd.DataFrame()
+
+def load_stock_listing():
+    """프로세스 공용 종목 목록 (ReferenceData). 세션마다 다시 받거나 복사하지 않는다."""
+    return get_reference_data().listing
+
+# --- 종목 검색 ---
+CHOSUNG = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+SEARCH_LIMIT = 10
+
+def to_chosung(text):
+    """한글 음절을 초성으로 바꾼다. 그 밖의 문자는 그대로 둔다. ('삼성전자' -> 'ㅅㅅㅈㅈ')"""
+    return "".join(CHOSUNG[(ord(ch) - 0xAC00) // 588] if 0xAC00 <= ord(ch) <= 0xD7A3 else ch for ch in text)
+
+def normalize_search_text(text):
+    return re.sub(r'\s+', '', str(text)).lower()
+
+def _is_subsequence(query, text):
+    it = iter(text)
+    return all(ch in it for ch in query)
+
+class TickerSearchIndex:
+    """종목명/코드/초성 검색 인덱스. 정확 > 접두 > 포함 > 퍼지 순으로 점수를 매기고 동점은 시가총액 순."""
+
+    def __init__(self, listing):
+        if 'Marcap' in listing:
+            listing = listing.sort_values('Marcap', ascending=False, na_position='last')
+        self.codes = listing['Code'].astype(str).tolist()
+        self.names = listing['Name'].astype(str).tolist()
+        self.name_keys = [normalize_search_text(n) for n in self.names]
+        self.chosung_keys = [to_chosung(k) for k in self.name_keys]
+        self.by_code = dict(zip(self.codes, self.names))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _score(self, q, i, chosung_query):
+        code, name, cho = self.codes[i], self.name_keys[i], self.chosung_keys[i]
+        if q == code: return 1000
+        if q == name: return 950
+        if code.startswith(q): return 800
+        if name.startswith(q): return 700
+        if chosung_query and cho.startswith(q): return 650
+        if q in name: return 500
+        if chosung_query and q in cho: return 450
+        if _is_subsequence(q, name): return 300 - (len(name) - len(q))
+        return 0
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """[(종목코드, 종목명)] 상위 limit개. 인덱스 순서가 시가총액 순이라 안정 정렬로 동점을 가른다."""
+        q = normalize_search_text(query)
+        if not q: return []
+        if q in self.by_code:
+            # 종목코드를 그대로 넣은 경우. 전체를 훑지 않는다.
+            return [(q, self.by_code[q])]
+        chosung_query = any(ch in CHOSUNG for ch in q)
+        if chosung_query: q = to_chosung(q)
+        scored = [(score, i) for i in range(len(self.codes)) if (score := self._score(q, i, chosung_query)) > 0]
+        if len(scored) < limit and not chosung_query:
+            # 오타 대비: 앞선 규칙으로 부족할 때만 유사도 비교를 한다.
+            seen = {i for _, i in scored}
+            for name in difflib.get_close_matches(q, self.name_keys, n=limit, cutoff=0.6):
+                i = self.name_keys.index(name)
+                if i not in seen: scored.append((100, i))
+        scored.sort(key=lambda x: -x[0])
+        return [(self.codes[i], self.names[i]) for _, i in scored[:limit]]
+
+def get_search_index():
+    return get_reference_data().search_index
+
+# --- 공용 기준 데이터 ---
+# 종목 목록과 검색 색인을 프로세스에 하나만 두고 모든 세션이 나눠 본다. 디스크 스냅샷으로 바로 시작하고,
+# 새 목록은 백그라운드에서 받아 색인까지 만든 뒤 통째로 바꿔 끼운다.
+REFERENCE_SNAPSHOT_PATH = DATA_DIR / "listing.csv"
+REFERENCE_REFRESH_INTERVAL = 3600
+REFERENCE_RETRY_INTERVAL = 60   # 갱신 확인(실패 시 재시도) 간격
+
+class ReferenceData:
+    """읽기 전용 (종목 목록, 검색 색인) 스냅샷. 읽는 쪽은 잠금 없이 현재 스냅샷을 본다.
+
+    listing 은 복사본을 돌려준다 (수천 행이라 1ms 미만). 호출자가 고쳐도 다른 세션이 보는 공유본은 그대로다.
+    """
+
+    def __init__(self, snapshot_path=None, refresh_interval=REFERENCE_REFRESH_INTERVAL, fetch=fetch_stock_listing):
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self.refresh_interval = refresh_interval
+        self.fetch = fetch
+        self.refreshes = 0
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="reference-data", daemon=True)
+        self._state = self._read_snapshot()
+        if self._state is None:
+            self._state = self._build(pd.DataFrame(columns=['Code', 'Name']), 'empty', 0.0)
+            self.refresh()  # 스냅샷이 없을 때만 첫 요청이 목록을 기다린다
+
+    @staticmethod
+    def _build(listing, source, loaded_at):
+        return {'listing': listing, 'search_index': TickerSearchIndex(listing), 'source': source, 'loaded_at': loaded_at}
+
+    @property
+    def listing(self):
+        return self._state['listing'].copy()
+
+    @property
+    def search_index(self):
+        return self._state['search_index']
+
+    @property
+    def source(self):
+        return self._state['source']
+
+    @property
+    def loaded_at(self):
+        return self._state['loaded_at']
+
+    def _read_snapshot(self):
+        if self.snapshot_path is None or not self.snapshot_path.exists(): return None
+        try: listing = pd.read_csv(self.snapshot_path, dtype={'Code': str})
+        except Exception:
+            note_failure('reference.snapshot')
+            return None
+        if listing.empty: return None
+        return self._build(listing, 'snapshot', self.snapshot_path.stat().st_mtime)
+
+    def _write_snapshot(self, listing):
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.snapshot_path.with_suffix('.tmp')
+        listing.to_csv(tmp, index=False)
+        os.replace(tmp, self.snapshot_path)
+
+    def refresh(self):
+        """새 목록으로 색인까지 만든 뒤 교체한다. 받지 못하면 기존 스냅샷을 그대로 둔다."""
+        with self._refresh_lock:
+            listing = self.fetch()
+            if listing.empty: return False
+            self._state = self._build(listing, 'live', time.time())
+            self.refreshes += 1
+            if self.snapshot_path is not None:
+                try: self._write_snapshot(listing)
+                except OSError: note_failure('reference.snapshot')
+            return True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            if time.time() - self.loaded_at >= self.refresh_interval:
+                try: self.refresh()
+                except Exception: logger.debug("reference refresh failed", exc_info=True)
+            if self._stop.wait(REFERENCE_RETRY_INTERVAL): return
+
+@st.cache_resource
+def get_reference_data():
+    # 재생/녹화 모드는 fixture 목록을 써야 하므로 운영 스냅샷을 읽거나 덮어쓰지 않는다.
+    return ReferenceData(REFERENCE_SNAPSHOT_PATH if http_mode() == "live" else None).start()
+
+NAVER_MAIN_URL = "https://finance.naver.com/item/main.naver?code={ticker}"
+NAVER_FRGN_URL = "https://finance.naver.com/item/frgn.naver?code={ticker}"
+NAVER_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+FETCH_TIMEOUT = 10  # 개별 요청 읽기 타임아웃(초)
+
+# --- HTTP 클라이언트 ---
+# 모든 네이버 요청이 하나의 세션을 공유해 호스트별 연결(TLS/keep-alive)을 재사용한다.
+HTTP_CONNECT_TIMEOUT = 3.05
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5          # 재시도 대기 = HTTP_BACKOFF * 2^시도 + 지터
+HTTP_BACKOFF_JITTER = 0.5
+HTTP_BACKOFF_MAX = 10
+HTTP_RETRY_STATUS = {429, 500, 502, 503, 504}
+HTTP_MAX_PER_HOST = 4       # 호스트별 동시 요청 수
+HTTP_POOL_SIZE = 16
+
+HTTP_HOST_RATE = 10         # 호스트별 초당 요청 수 (프로세스 전체, 모든 세션 공유)
+HTTP_HOST_BURST = 10
+HTTP_HOST_RATES = {'ssl.pstatic.net': (20, 20)}  # 호스트별 (초당 요청, 버스트) 예외
+HTTP_HOST_MAX_WAITERS = 64  # 호스트별로 토큰을 기다릴 수 있는 요청 수. 넘치면 기다리지 않고 실패시킨다
+
+class RateLimited(requests.RequestException):
+    """호스트 대기열이 가득 차서 요청을 보내지 않았다."""
+
+class RateLimiter:
+    """스레드 안전 토큰 버킷. acquire()는 토큰이 생길 때까지 기다린다.
+
+    토큰을 미리 예약(음수 잔량)하고 그만큼 자므로 먼저 온 요청이 먼저 나간다.
+    max_waiters 를 주면 이미 그만큼 기다리는 중일 때 RateLimited 를 올린다.
+    """
+
+    def __init__(self, rate, burst=None, max_waiters=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.max_waiters = max_waiters
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._waiting = 0
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self):
+        """대기한 시간(초)을 돌려준다."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1 and self.max_waiters is not None and self._waiting >= self.max_waiters:
+                self.rejected += 1
+                raise RateLimited(f"대기 요청 {self._waiting}개 초과")
+            self._tokens -= 1
+            self.acquired += 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if wait:
+                self._waiting += 1
+                self.throttled += 1
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+        if wait:
+            try: time.sleep(wait)
+            finally:
+                with self._lock: self._waiting -= 1
+        return wait
+
+    def stats(self):
+        with self._lock:
+            return {'acquired': self.acquired, 'throttled': self.throttled, 'rejected': self.rejected,
+                    'waiting': self._waiting, 'wait_total': self.wait_total, 'wait_max': self.wait_max}
+
+class _Flight:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class SingleFlight:
+    """같은 키로 동시에 들어온 호출은 먼저 온 하나만 실행하고, 나머지는 끝나기를 기다려 같은 결과를 받는다."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.wait_total = 0.0
+
+    def do(self, key, func):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            count('http.coalesced')
+            start = time.monotonic()
+            flight.done.wait()
+            with self._lock: self.wait_total += time.monotonic() - start
+            if flight.error is not None: raise flight.error
+            return flight.value
+        try:
+            flight.value = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock: del self._flights[key]
+            flight.done.set()
+        return flight.value
+
+    def stats(self):
+        with self._lock:
+            return {'leaders': self.leaders, 'coalesced': self.coalesced, 'wait_total': self.wait_total,
+                    'in_flight': len(self._flights)}
+
+class HttpClient:
+    """연결 풀 + 재시도/백오프 + 호스트별 동시성/속도 제한을 갖춘 공유 클라이언트.
+
+    requests.Session 의 연결 풀(urllib3)은 스레드 안전하며, 세션 설정은 생성 후 바꾸지 않는다.
+    프로세스에 하나만 만들어 모든 세션이 같은 URL 요청을 한 번으로 묶고(single-flight),
+    호스트별 토큰 버킷을 함께 쓴다.
+    """
+
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=FETCH_TIMEOUT, retries=HTTP_RETRIES,
+                 backoff=HTTP_BACKOFF, jitter=HTTP_BACKOFF_JITTER, max_per_host=HTTP_MAX_PER_HOST, pool_size=HTTP_POOL_SIZE,
+                 mode="live", fixtures=None):
+        self.mode = mode
+        self.fixtures = Path(fixtures) if fixtures else None
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.jitter = jitter
+        self.max_per_host = max_per_host
+        self.session = requests.Session()
+        self.session.headers.update(NAVER_HEADERS)
+        self.session.verify = False
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._host_slots = {}
+        self._host_limiters = {}
+        self._lock = threading.Lock()
+        self.flights = SingleFlight()
+
+    def _host_slot(self, host):
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return slot
+
+    def _host_limiter(self, host):
+        with self._lock:
+            limiter = self._host_limiters.get(host)
+            if limiter is None:
+                rate, burst = HTTP_HOST_RATES.get(host, (HTTP_HOST_RATE, HTTP_HOST_BURST))
+                limiter = self._host_limiters[host] = RateLimiter(rate, burst, HTTP_HOST_MAX_WAITERS)
+            return limiter
+
+    def host_stats(self):
+        with self._lock:
+            limiters = dict(self._host_limiters)
+        return {host: limiter.stats() for host, limiter in sorted(limiters.items())}
+
+    def _sleep_before_retry(self, attempt, retry_after=None):
+        delay = min(HTTP_BACKOFF_MAX, self.backoff * (2 ** attempt)) + random.uniform(0, self.jitter)
+        if retry_after:
+            try: delay = max(delay, min(HTTP_BACKOFF_MAX, float(retry_after)))
+            except ValueError: pass
+        time.sleep(delay)
+
+    def fixture_path(self, url):
+        """녹화 파일 경로: <fixtures>/<host>/<경로_쿼리>.html (+ 같은 이름의 .json 메타데이터)"""
+        parts = urlsplit(url)
+        slug = re.sub(r'[^A-Za-z0-9._=-]+', '_', parts.path.strip('/') + ('_' + parts.query if parts.query else ''))
+        return self.fixtures / parts.hostname / f"{slug}.html"
+
+    def _record(self, url, response):
+        path = self.fixture_path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(response.content)
+        meta = {'url': url, 'status_code': response.status_code, 'encoding': response.encoding,
+                'headers': {k: v for k, v in response.headers.items() if k.lower() in ('content-type', 'etag', 'last-modified')}}
+        path.with_suffix('.json').write_text(json.dumps(meta, ensure_ascii=False, indent=1), encoding='utf-8')
+
+    def _replay(self, url):
+        path = self.fixture_path(url)
+        response = requests.Response()
+        response.url = url
+        if not path.exists():
+            response.status_code = 404
+            response.reason = "fixture missing"
+            response._content = b""
+            return response
+        meta_path = path.with_suffix('.json')
+        meta = json.loads(meta_path.read_text(encoding='utf-8')) if meta_path.exists() else {}
+        response.status_code = meta.get('status_code', 200)
+        response.headers.update(meta.get('headers', {}))
+        response.encoding = meta.get('encoding')
+        response._content = path.read_bytes()
+        return response
+
+    def get(self, url, timeout=None, **kwargs):
+        with span('fetch'):
+            if self.mode == "replay":
+                return self._replay(url)
+            if kwargs:  # 조건부 요청처럼 헤더가 다르면 응답도 다르므로 묶지 않는다
+                return self._fetch(url, timeout, **kwargs)
+            return self.flights.do(url, lambda: self._fetch(url, timeout))
+
+    def _fetch(self, url, timeout=None, **kwargs):
+        response = self._get_live(url, timeout, **kwargs)
+        if self.mode == "record":
+            self._record(url, response)
+        return response
+
+    def _get_live(self, url, timeout=None, **kwargs):
+        host = urlsplit(url).hostname
+        slot = self._host_slot(host)
+        limiter = self._host_limiter(host)
+        for attempt in range(self.retries + 1):
+            try: waited = limiter.acquire()
+            except RateLimited:
+                count('http.rejected')
+                raise
+            if waited:
+                count('http.throttled')
+                count('http.throttle_wait_ms', round(waited * 1000))
+            try:
+                with slot:
+                    response = self.session.get(url, timeout=timeout or self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries: raise
+                count('http.retry')
+                self._sleep_before_retry(attempt)
+                continue
+            if response.status_code in HTTP_RETRY_STATUS and attempt < self.retries:
+                count('http.retry')
+                self._sleep_before_retry(attempt, response.headers.get('Retry-After'))
+                continue
+            return response
+
+@st.cache_resource
+def get_http_client():
+    return HttpClient(mode=http_mode(), fixtures=fixture_dir())
+
+def http_get(url, **kwargs):
+    return get_http_client().get(url, **kwargs)
+
+def bounded_call(func, *args, timeout, name):
+    """타임아웃이 없는 라이브러리 호출(pykrx, FinanceDataReader)을 데몬 스레드에서 돌리고 timeout 초까지만 기다린다.
+    멈춘 호출은 버려 두고(작업 풀 스레드를 붙잡지도, 종료를 막지도 않는다) TimeoutError 를 올린다."""
+    result = {}
+    def run():
+        try: result['value'] = func(*args)
+        except Exception as e: result['error'] = e
+    worker = threading.Thread(target=run, name=name, daemon=True)
+    worker.start()
+    worker.join(timeout)
+    if worker.is_alive():
+        count(f'{name}.timeout')
+        raise TimeoutError(f"{name} 응답이 {timeout}초 안에 오지 않았습니다")
+    if 'error' in result: raise result['error']
+    return result['value']
+
+# --- 차트 이미지 ---
+# pstatic 캔들 차트를 서버에서 한 번 받아 여러 세션이 나눠 쓴다. 주기별 시간 구간 안에서는 다시 묻지 않고,
+# 구간이 바뀌면 ETag/Last-Modified 로 재검증해 바뀌지 않았으면(304) 본문을 다시 받지 않는다.
+CHART_URL = "https://ssl.pstatic.net/imgfinance/chart/item/candle/{period}/{ticker}.png"
+CHART_PERIODS = {"일봉": "day", "주봉": "week", "월봉": "month"}
+CHART_FRESHNESS = {'day': 300, 'week': 3600, 'month': 6 * 3600}  # 구간 길이(초)
+CHART_CACHE_MAX = 256
+
+class ChartImageCache:
+    """(종목, 주기)별 차트 PNG 캐시. get() 은 bytes 또는 None 을 돌려준다."""
+
+    def __init__(self, client, max_entries=CHART_CACHE_MAX):
+        self.client = client
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # url -> {'content', 'etag', 'last_modified', 'bucket'}
+        self._lock = threading.Lock()
+
+    def get(self, ticker, period):
+        url = CHART_URL.format(period=period, ticker=ticker)
+        bucket = int(time.time() // CHART_FRESHNESS.get(period, 300))
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None: self._entries.move_to_end(url)
+        if entry is not None and entry['bucket'] == bucket:
+            count('chart.hit')
+            return entry['content']
+
+        headers = {}
+        if entry is not None:
+            if entry['etag']: headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']: headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            response = self.client.get(url, headers=headers)
+        except requests.RequestException:
+            note_failure('chart')
+            return entry['content'] if entry else None
+
+        if response.status_code == 304 and entry is not None:
+            count('chart.revalidated')
+            new_entry = dict(entry, bucket=bucket)
+        elif response.status_code == 200 and response.content:
+            count('chart.fetched')
+            new_entry = {'content': response.content, 'etag': response.headers.get('ETag'),
+                         'last_modified': response.headers.get('Last-Modified'), 'bucket': bucket}
+        else:
+            note_failure('chart')
+            return entry['content'] if entry else None
+        with self._lock:
+            self._entries[url] = new_entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return new_entry['content']
+
+@st.cache_resource
+def get_chart_cache():
+    return ChartImageCache(get_http_client())
+
+# --- HTML 파싱 ---
+# 추출기가 실제로 읽는 main.naver 영역. 회사명, 현재가/등락, 기업개요, 투자정보(시총/주식수/PER 등),
+# 기업실적분석, 동일업종비교 순.
+NAVER_MAIN_SECTIONS = [
+    ('class', 'wrap_company'), ('class', 'rate_info'), ('id', 'summary_info'), ('id', 'tab_con1'),
+    ('class', 'section cop_analysis'), ('class', 'section trade_compare'),
+]
+
+def _section_xpath(sections):
+    parts = []
+    for attr, value in sections:
+        if attr == 'id':
+            parts.append(f"//*[@id='{value}']")
+        else:
+            conds = " and ".join(f"contains(concat(' ', normalize-space(@class), ' '), ' {c} ')" for c in value.split())
+            parts.append(f"//div[{conds}]")
+    return " | ".join(parts)
+
+NAVER_MAIN_XPATH = _section_xpath(NAVER_MAIN_SECTIONS)
+
+def parse_naver_main_html(html, partial=True):
+    with span('parse'):
+        return _parse_naver_main_html(html, partial)
+
+def _parse_naver_main_html(html, partial):
+    """main.naver HTML을 soup로 만든다.
+
+    lxml이 있으면 문서 전체는 lxml로 빠르게 읽고, 필요한 영역만 문서 순서대로 잘라 BeautifulSoup에 넘긴다.
+    영역을 하나도 찾지 못하면(마크업 변경 등) 전체 문서를 그대로 파싱한다.
+    """
+    if lxml_html is None:
+        return BeautifulSoup(html, 'html.parser')
+    if partial:
+        try:
+            doc = lxml_html.fromstring(html)
+            picked = []
+            for node in doc.xpath(NAVER_MAIN_XPATH):
+                if any(anc in picked for anc in node.iterancestors()): continue
+                picked.append(node)
+            if picked:
+                fragment = "".join(etree.tostring(node, encoding='unicode', method='html', with_tail=False) for node in picked)
+                return BeautifulSoup(fragment, 'lxml')
+        except Exception:
+            note_failure('parse.partial')
+    return BeautifulSoup(html, 'lxml')
+
+# main.naver 한 페이지에서 시세/재무/동종업종을 모두 뽑으므로 한 번만 받아서 파싱한다.
+# 네트워크 오류는 그대로 올리고, 200이 아니면 None을 돌려준다.
+def fetch_naver_main(ticker):
+    response = http_get(NAVER_MAIN_URL.format(ticker=ticker))
+    if response.status_code != 200:
+        return None
+    return parse_naver_main_html(response.text)
+
+# --- 종목 레코드 ---
+# 화면 문자열이 아니라 숫자로 한 번만 파싱해 보관한다. 값이 없으면 None, 문자열 포맷은 그릴 때만 한다.
+def parse_number(text):
+    """'71,300' / '+1.71%' / '55.12%' -> float. 비었거나 '-' 면 None."""
+    if text is None: return None
+    match = re.search(r'-?\d+(?:\.\d+)?', text.replace(',', '').replace('+', ''))
+    return float(match.group()) if match else None
+
+def parse_int(text):
+    """'+12,345' -> 12345. 비었거나 '-' 면 None (0 으로 바꾸지 않는다)."""
+    value = parse_number(text)
+    return None if value is None else int(value)
+
+def parse_market_cap(text):
+    """'425조 6,432' -> 4256432.0 (억원). 없으면 None."""
+    match = re.fullmatch(r'(?:([\d,]+)조)?([\d,]*)', re.sub(r'\s+', '', text or ''))
+    if not match or not any(match.groups()): return None
+    jo, rest = (int(g.replace(',', '')) if g else 0 for g in match.groups())
+    return float(jo * 10000 + rest)
+
+@dataclass(slots=True)
+class StockQuote:
+    """main.naver 시세/투자지표. 가격은 원, 시가총액은 억원, 비율은 %."""
+    ticker: str
+    name: str
+    overview: str = "정보 없음"
+    price: float | None = None
+    change: float | None = None       # 전일 대비 (부호 없음, direction 참고)
+    change_rate: float | None = None  # 전일 대비 % (부호 없음)
+    direction: str = 'flat'            # up / upper / down / lower / flat
+    market_cap: float | None = None
+    shares: int | None = None
+    foreign_rate: float | None = None
+    per: float | None = None
+    eps: float | None = None
+    pbr: float | None = None
+    bps: float | None = None
+    dvr: float | None = None
+    high_52: float | None = None
+    low_52: float | None = None
+
+    @property
+    def price_or_zero(self):
+        return self.price or 0.0
+
+    @property
+    def signed_change_rate(self):
+        if self.change_rate is None: return None
+        return -self.change_rate if self.direction in ('down', 'lower') else self.change_rate
+
+@dataclass(slots=True)
+class InvestorDay:
+    """frgn.naver 일별 투자자 매매. 순매매는 주 단위, 비율은 %. 칸이 비었으면 None (순매매 0 과 구분한다)."""
+    date: str
+    close: float | None
+    change_rate: float | None
+    inst_net: int | None
+    frgn_net: int | None
+    hold_rate: float | None
+
+def fmt_number(value, spec='{:,.0f}', missing='-'):
+    return missing if value is None else spec.format(value)
+
+def fmt_market_cap(value):
+    if value is None: return '-'
+    jo, rest = divmod(int(round(value)), 10000)
+    if not jo: return f"{rest:,} 억원"
+    return f"{jo:,}조 {rest:,} 억원" if rest else f"{jo:,}조 억원"
+
+def get_naver_stock_details(ticker, soup=None):
+    try:
+        if soup is None: soup = fetch_naver_main(ticker)
+        return extract_stock_details(soup, ticker)
+    except Exception:
+        note_failure('details')
+        return StockQuote(ticker=ticker, name=ticker, overview="로딩 실패")
+
+def extract_stock_details(soup, ticker):
+    with span('extract'):
+        return _extract_stock_details(soup, ticker)
+
+def _extract_stock_details(soup, ticker):
+    data = StockQuote(ticker=ticker, name=ticker)
+    
+    if soup is not None:
+        name_tag = soup.select_one(".wrap_company h2 a")
+        if name_tag: data.name = name_tag.text.strip()
+
+        overview = extract_company_overview(soup)
+        if overview: data.overview = overview
+
+        try:
+            now_tag = soup.select_one(".no_today .blind")
+            if now_tag: data.price = parse_number(now_tag.text)
+            
+            exday_tag = soup.select_one(".no_exday")
+            if exday_tag:
+                spans = exday_tag.select("span.blind")
+                if len(spans) >= 2:
+                    data.change = parse_number(spans[0].text)
+                    data.change_rate = parse_number(spans[1].text)
+                
+                if exday_tag.select_one(".ico.up"): data.direction = 'up'
+                elif exday_tag.select_one(".ico.down"): data.direction = 'down'
+                elif exday_tag.select_one(".ico.upper"): data.direction = 'upper'
+                elif exday_tag.select_one(".ico.lower"): data.direction = 'lower'
+        except Exception: note_failure('details.price')
+
+        try:
+            mc_element = soup.select_one("#_market_sum")
+            if mc_element: data.market_cap = parse_market_cap(mc_element.text)
+        except Exception: note_failure('details.market_cap')
+
+        try:
+            first_table = soup.select_one("div.first table")
+            if first_table:
+                for tr in first_table.select("tr"):
+                    if "상장주식수" in tr.text:
+                        em = tr.select_one("em")
+                        if em:
+                            shares_str = em.text.strip().replace(',', '')
+                            data.shares = int(shares_str)
+                        break
+        except Exception: note_failure('details.shares')
+
+        try:
+            for field in ('per', 'eps', 'pbr', 'dvr'):
+                el = soup.select_one(f"#_{field}")
+                if el: setattr(data, field, parse_number(el.text))
+        except Exception: note_failure('details.per')
+
+        all_ths = soup.select("th")
+        for th in all_ths:
+            th_text = th.text.strip()
+            if "외국인소진율" in th_text:
+                td = th.find_next_sibling("td")
+                if td:
+                    em = td.select_one("em")
+                    data.foreign_rate = parse_number(em.text if em else td.text)
+            elif "52주최고" in th_text:
+                td = th.find_next_sibling("td")
+                if td:
+                    ems = td.select("em")
+                    if len(ems) >= 2:
+                        data.high_52 = parse_number(ems[0].text)
+                        data.low_52 = parse_number(ems[1].text)
+            elif "BPS" in th_text and "PBR" not in th_text:
+                td = th.find_next_sibling("td")
+                if td:
+                    em = td.select_one("em")
+                    data.bps = parse_number(em.text if em else td.text)
+        
+        if data.bps is None:
+            try:
+                per_table = soup.select_one("table.per_table")
+                if per_table:
+                    rows = per_table.select("tr")
+                    for r in rows:
+                        if "BPS" in r.text:
+                            ems = r.select("em")
+                            if len(ems) >= 2: data.bps = parse_number(ems[1].text)
+                            elif len(ems) == 1: data.bps = parse_number(ems[0].text)
+            except Exception: note_failure('details.bps')
+
+    return data
+
+def extract_company_overview(soup):
+    if soup is None: return ""
+    overview_div = soup.select_one("#summary_info")
+    if not overview_div: return ""
+    return "\n ".join([p.text.strip() for p in overview_div.select("p") if p.text.strip()])
+
+INVESTOR_TABLE_XPATH = "//table[contains(concat(' ', normalize-space(@class), ' '), ' type2 ')]"  # = table.type2
+
+def investor_page_cells(html, use_lxml=True):
+    """frgn.naver 의 두 번째 table.type2 에서 행별 td 글자 목록. lxml 이 있으면 soup 을 만들지 않고 lxml 로 바로 읽는다."""
+    if use_lxml and lxml_html is not None:
+        if not html.strip(): return []
+        tables = lxml_html.fromstring(html).xpath(INVESTOR_TABLE_XPATH)
+        if len(tables) < 2: return []
+        return [[td.text_content() for td in row.xpath(".//td")] for row in tables[1].xpath(".//tr")]
+    tables = BeautifulSoup(html, 'html.parser').select("table.type2")
+    if len(tables) < 2: return []
+    return [[td.text for td in row.select("td")] for row in tables[1].select("tr")]
+
+def parse_investor_page(html, use_lxml=True):
+    """frgn.naver 한 페이지의 일별 매매 행 (최근 날짜 순)"""
+    with span('parse'): rows = investor_page_cells(html, use_lxml)
+    trends = []
+    for cols in rows:
+        if len(cols) == 9:
+            trends.append(InvestorDay(
+                date=cols[0].strip(), close=parse_number(cols[1]),
+                change_rate=parse_number(re.sub(r'\s+', '', cols[3])),
+                inst_net=parse_int(cols[5]), frgn_net=parse_int(cols[6]),
+                hold_rate=parse_number(cols[8])))
+    return trends
+
+def fetch_investor_page(ticker, page=1):
+    """page 번째 frgn.naver 페이지. 200 이 아닌 응답과 네트워크 오류는 예외로 올린다.
+    빈 목록은 '정상 응답인데 행이 없다(기록의 끝)'는 뜻으로만 쓴다."""
+    url = NAVER_FRGN_URL.format(ticker=ticker) + (f"&page={page}" if page > 1 else "")
+    response = http_get(url)
+    if response.status_code != 200:
+        raise requests.HTTPError(f"frgn.naver {response.status_code}", response=response)
+    return parse_investor_page(response.text)
+
+def get_investor_trend(ticker):
+    try:
+        return fetch_investor_page(ticker)[:10]
+    except Exception:
+        note_failure('investor')
+        return []
+
+def get_same_industry_comparison(ticker, soup=None):
+    try:
+        if soup is None: soup = fetch_naver_main(ticker)
+        return extract_industry_comparison(soup)
+    except Exception:
+        note_failure('peers')
+        return pd.DataFrame()
+
+def extract_industry_comparison(soup):
+    with span('extract'):
+        return _extract_industry_comparison(soup)
+
+def _extract_industry_comparison(soup):
+    if soup is not None:
+        compare_section = soup.select_one("div.section.trade_compare")
+        if compare_section:
+            table = compare_section.select_one("table")
+            if table:
+                headers = ["구분"]
+                thead = table.select_one("thead")
+                for th in thead.select("th"):
+                    if th.find("a"):
+                        raw_header = th.text.strip()
+                        clean_header = raw_header.split('*')[0].strip()
+                        headers.append(clean_header)
+                
+                rows_data = []
+                tbody = table.select_one("tbody")
+                for tr in tbody.select("tr"):
+                    row_val = []
+                    th_item = tr.select_one("th")
+                    row_title = ""
+                    if th_item:
+                        row_title = th_item.text.strip()
+                        row_val.append(row_title)
+                    
+                    for td in tr.select("td"):
+                        raw_text = td.text.strip()
+                        clean_text = re.sub(r'[\n\t]+', ' ', raw_text)
+                        clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+                        
+                        if row_title in ["전일대비", "등락률"]:
+                            val_text = re.sub(r'[^0-9.,%]', '', clean_text)
+                            if "상향" in clean_text or "상승" in clean_text or "+" in clean_text:
+                                clean_text = f'<span style="color:#d20000">+{val_text}</span>'
+                            elif "하향" in clean_text or "하락" in clean_text or "-" in clean_text:
+                                clean_text = f'<span style="color:#0051c7">-{val_text}</span>'
+                            elif "보합" in clean_text:
+                                clean_text = val_text
+                        
+                        row_val.append(clean_text)
+                    
+                    if len(row_val) == len(headers):
+                         rows_data.append(row_val)
+                    elif len(row_val) > len(headers):
+                         rows_data.append(row_val[:len(headers)])
+
+                return pd.DataFrame(rows_data, columns=headers)
+    return pd.DataFrame()
+
+def clean_float(text):
+    if not text or text.strip() in ['-', 'N/A', '', '.']:
+        return 0.0
+    try:
+        text = text.replace(',', '')
+        match = re.search(r'-?\d+\.?\d*', text)
+        if match:
+            return float(match.group())
+        return 0.0
+    except:
+        return 0.0
+
+def get_financials_from_naver(ticker, current_price=0, shares=0, soup=None):
+    try:
+        if soup is None: soup = fetch_naver_main(ticker)
+        return extract_financials(soup, current_price, shares)
+    except Exception:
+        note_failure('financials')
+        return [], []
+
+# 기업실적분석 표의 행 제목 -> 지표 키. 앞에서부터 처음 포함되는 항목으로 매칭한다.
+FINANCIAL_ITEMS = {
+    "매출액": "revenue", "영업이익": "op_income", "당기순이익": "net_income",
+    "영업이익률": "op_margin", "순이익률": "net_income_margin", "ROE": "roe",
+    "부채비율": "debt_ratio", "당좌비율": "quick_ratio", "유보율": "reserve_ratio",
+    "EPS": "eps", "BPS": "bps", "PER": "per", "PBR": "pbr",
+    "주당배당금": "dps", "배당성향": "payout_ratio", "시가배당률": "dividend_yield",
+}
+
+def match_financial_key(label):
+    label = label.replace(" ", "")
+    for k_txt, k_key in FINANCIAL_ITEMS.items():
+        if k_txt in label:
+            if k_txt in ("영업이익", "당기순이익") and "률" in label: continue
+            return k_key
+    return None
+
+def extract_financial_frames(soup):
+    with span('extract'):
+        return _extract_financial_frames(soup)
+
+def _extract_financial_frames(soup):
+    """기업실적분석 표를 한 번만 훑어 (연간 최근 3년, 분기 최근 5분기) DataFrame을 만든다.
+
+    index 는 기간(date), 컬럼은 지표 키. 표에 칸이 없는 값은 NaN, '-' 는 0.0 이다.
+    """
+    empty = (pd.DataFrame(), pd.DataFrame())
+    if soup is None: return empty
+    finance_table = soup.select_one("div.section.cop_analysis > div.sub_section > table")
+    if not finance_table: return empty
+
+    header_rows = finance_table.select("thead > tr")
+    date_cols = [th.text.strip() for th in header_rows[1].select("th")]
+    n_cols = len(date_cols)
+
+    annual_idxs = [i for i, col in enumerate(date_cols) if i < 4 and "(E)" not in col][-3:]
+    quarter_idxs = [i for i, col in enumerate(date_cols) if i >= 4 and "(E)" not in col][-5:]
+
+    # 행마다 지표 키를 한 번만 매칭하고, 오른쪽 정렬된 셀들을 기간 축에 그대로 옮긴다.
+    columns = {}
+    for row in finance_table.select("tbody > tr"):
+        key = match_financial_key(row.th.text.strip())
+        if key is None: continue
+        cells = row.select("td")
+        offset = n_cols - len(cells)
+        values = columns.setdefault(key, [np.nan] * n_cols)
+        for j, td in enumerate(cells):
+            if 0 <= offset + j < n_cols:
+                values[offset + j] = clean_float(td.text.strip())
+
+    frame = pd.DataFrame(columns, index=pd.Index([col.split('(')[0] for col in date_cols], name='date'), dtype=float)
+    return frame.iloc[annual_idxs], frame.iloc[quarter_idxs]
+
+# 재무 데이터는 몇 시간씩 캐시하므로 현재가 기반 지표(SPS/PSR)는 캐시 밖에서 컬럼 연산으로 붙인다.
+def apply_price_ratios(frame, current_price, shares):
+    """SPS/PSR 열을 붙인 새 프레임. 붙일 게 없으면 받은 프레임을 그대로 돌려준다 (호출자는 고치지 않는다)."""
+    if shares <= 0 or 'revenue' not in frame:
+        return frame
+    revenue = frame['revenue'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sps = np.where(revenue != 0, revenue * 100000000 / shares, np.nan)
+        ratios = {'sps': sps, 'psr': current_price / sps} if current_price > 0 else {'sps': sps}
+    return frame.assign(**ratios)
+
+def financial_records(frame):
+    """DataFrame -> 화면용 [{'date': ..., 지표: 값}] (값이 없는 지표는 키를 넣지 않는다)
+
+    행마다 Series 를 만들지 않고 numpy 배열에서 바로 dict 를 만든다. 모든 열이 float 이라 NaN 은 v != v 로 거른다.
+    """
+    columns = list(frame.columns)
+    rows = frame.to_numpy(dtype=float).tolist()
+    return [{'date': date, **{k: v for k, v in zip(columns, row) if v == v}} for date, row in zip(frame.index, rows)]
+
+def extract_financials(soup, current_price=0, shares=0):
+    annual_df, quarter_df = extract_financial_frames(soup)
+    return (financial_records(apply_price_ratios(annual_df, current_price, shares)),
+            financial_records(apply_price_ratios(quarter_df, current_price, shares)))
+
+def calculate_srim(bps, roe, rrr):
+    if rrr <= 0: return 0
+    excess_profit_rate = (roe - rrr) / 100
+    fair_value = bps + (bps * excess_profit_rate / (rrr / 100))
+    return fair_value
+
+# --- 종목별 캐시 ---
+# 데이터 종류별 유효시간(초). 시세는 짧게, 재무제표/기업개요는 길게 유지한다.
+CACHE_TTL = {
+    'quote': 10,
+    'overview': 6 * 3600,
+    'financials': 6 * 3600,
+    'investor': 300,
+    'peers': 600,
+}
+CACHE_MAX_ENTRIES = 8192  # 스크리너가 전 종목 재무를 담을 수 있도록
+
+class TickerCache:
+    """(데이터 종류, 종목코드) 단위 TTL + LRU 캐시. 여러 세션/스레드가 공유한다.
+
+    만료된 항목도 LRU 로 밀려날 때까지 남겨 두어, 새 값이 늦을 때 peek() 로 이전 값을 보여줄 수 있다.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = dict(ttl)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kind, ticker):
+        key = (kind, ticker)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, fetched_at = entry
+            if time.time() - fetched_at > self.ttl.get(kind, 0):
+                return None
+            self._entries.move_to_end(key)
+            return value, fetched_at
+
+    def peek(self, kind, ticker):
+        """만료 여부와 관계없이 마지막으로 저장된 (값, 저장 시각). 없으면 None."""
+        with self._lock:
+            return self._entries.get((kind, ticker))
+
+    def put(self, kind, ticker, value):
+        key = (kind, ticker)
+        fetched_at = time.time()
+        with self._lock:
+            self._entries[key] = (value, fetched_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fetched_at
+
+    def get_or_fetch(self, kind, ticker, fetch, cacheable=None):
+        """캐시에 있으면 그대로, 없으면 fetch() 결과를 저장해 돌려준다. (값, 상태) 반환."""
+        cached = self.get(kind, ticker)
+        if cached is not None:
+            with self._lock: self.hits += 1
+            count('cache.hit')
+            value, fetched_at = cached
+            return value, {'hit': True, 'age': time.time() - fetched_at, 'version': fetched_at}
+
+        with self._lock: self.misses += 1
+        count('cache.miss')
+        value = fetch()
+        version = None
+        if cacheable is None or cacheable(value):
+            version = self.put(kind, ticker, value)
+        return value, {'hit': False, 'age': 0.0, 'version': version}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+@st.cache_resource
+def get_ticker_cache():
+    return TickerCache(CACHE_TTL, CACHE_MAX_ENTRIES)
+
+# --- 재무 스냅샷 저장소 ---
+# 연간/분기 재무를 (종목, 주기, 기간) 단위로 SQLite에 보관해 재시작 후에도 다시 긁지 않는다.
+FINANCIAL_STORE_PATH = DATA_DIR / "financials.sqlite3"
+FINANCIAL_METRICS = list(dict.fromkeys(FINANCIAL_ITEMS.values()))
+REPORT_LAG_DAYS = 45               # 분기 종료 후 실적이 반영되기까지의 여유
+STORE_RECHECK_INTERVAL = 24 * 3600  # 최신 분기가 아직 없을 때 다시 확인하는 간격
+STORE_MAX_AGE = 30 * 86400          # 정정 공시 반영을 위해 이보다 오래된 스냅샷은 새로 받는다
+
+def expected_latest_quarter(now=None):
+    """공시 지연을 감안해 지금쯤 나와 있어야 할 가장 최근 분기 ('YYYY.MM')"""
+    d = ((now or datetime.now()) - timedelta(days=REPORT_LAG_DAYS)).date()
+    year, month = d.year, ((d.month - 1) // 3) * 3
+    if month == 0: year, month = year - 1, 12
+    return f"{year}.{month:02d}"
+
+class SqliteStore:
+    """SQLite 저장소 공통부. 스레드마다 연결을 새로 열고, 쓰기는 잠금으로 직렬화한다."""
+    schema = ()
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                conn.execute(statement)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn: yield conn
+        finally:
+            conn.close()
+
+class FinancialStore(SqliteStore):
+    """재무 스냅샷 저장소."""
+    schema = (
+        f"CREATE TABLE IF NOT EXISTS financials (ticker TEXT NOT NULL, freq TEXT NOT NULL, period TEXT NOT NULL, {', '.join(f'{m} REAL' for m in FINANCIAL_METRICS)}, PRIMARY KEY (ticker, freq, period))",
+        "CREATE TABLE IF NOT EXISTS snapshots (ticker TEXT PRIMARY KEY, fetched_at REAL NOT NULL, latest_quarter TEXT)",
+    )
+
+    def snapshot(self, ticker):
+        with self._connect() as conn:
+            return conn.execute("SELECT fetched_at, latest_quarter FROM snapshots WHERE ticker = ?", (ticker,)).fetchone()
+
+    def is_stale(self, ticker, now=None):
+        snap = self.snapshot(ticker)
+        if snap is None: return True
+        fetched_at, latest_quarter = snap
+        age = (now or time.time()) - fetched_at
+        if age > STORE_MAX_AGE: return True
+        return (latest_quarter or "") < expected_latest_quarter() and age > STORE_RECHECK_INTERVAL
+
+    def stale_tickers(self, tickers):
+        return [t for t in tickers if self.is_stale(t)]
+
+    def load(self, ticker, n_annual=3, n_quarter=5):
+        """저장된 최근 n개 기간을 extract_financial_frames 와 같은 모양으로 돌려준다."""
+        with self._connect() as conn:
+            df = pd.read_sql_query("SELECT * FROM financials WHERE ticker = ? ORDER BY period", conn, params=(ticker,))
+        def frame(freq, n):
+            part = df[df['freq'] == freq].drop(columns=['ticker', 'freq']).set_index('period').tail(n)
+            part.index.name = 'date'
+            return part.dropna(axis=1, how='all').astype(float)
+        return frame('annual', n_annual), frame('quarter', n_quarter)
+
+    def save(self, ticker, annual_df, quarter_df):
+        """기간 단위로 upsert 한다. 네이버 화면에서 밀려난 과거 기간은 그대로 남는다."""
+        rows = []
+        for freq, df in (('annual', annual_df), ('quarter', quarter_df)):
+            for period, values in zip(df.index, df.reindex(columns=FINANCIAL_METRICS).to_numpy()):
+                rows.append((ticker, freq, period, *[None if pd.isna(v) else float(v) for v in values]))
+        latest_quarter = max(quarter_df.index) if len(quarter_df) else None
+        placeholders = ", ".join("?" * (3 + len(FINANCIAL_METRICS)))
+        with self._lock, self._connect() as conn:
+            conn.executemany(f"INSERT OR REPLACE INTO financials (ticker, freq, period, {', '.join(FINANCIAL_METRICS)}) VALUES ({placeholders})", rows)
+            conn.execute("INSERT OR REPLACE INTO snapshots (ticker, fetched_at, latest_quarter) VALUES (?, ?, ?)", (ticker, time.time(), latest_quarter))
+
+@st.cache_resource
+def get_financial_store():
+    return FinancialStore(FINANCIAL_STORE_PATH)
+
+def load_financial_frames(ticker, fetch_soup, store=None):
+    """저장소 우선으로 재무 DataFrame 을 얻는다. 오래된 경우에만 네이버에서 받아 저장소를 갱신한다."""
+    store = store or get_financial_store()
+    if not store.is_stale(ticker):
+        return store.load(ticker)
+    try:
+        soup = fetch_soup()
+        annual_df, quarter_df = extract_financial_frames(soup)
+    except Exception:
+        note_failure('financials')
+        soup, annual_df, quarter_df = None, pd.DataFrame(), pd.DataFrame()
+    if annual_df.empty and quarter_df.empty:
+        # 페이지는 받았는데 실적 표가 없는 종목(ETF, 스팩 등)은 빈 스냅샷(latest_quarter 없음)을 남겨
+        # STORE_RECHECK_INTERVAL 동안 다시 받지 않는다. 받기에 실패했으면 남기지 않고 다음에 다시 묻는다.
+        if soup is not None: store.save(ticker, annual_df, quarter_df)
+        return store.load(ticker)  # 예전 스냅샷이 있으면 그것이라도 쓴다
+    store.save(ticker, annual_df, quarter_df)
+    return annual_df, quarter_df
+
+# --- 가격 이력 (OHLCV) ---
+# 일봉을 (종목, 날짜) 단위로 SQLite 에 쌓아 두고, 갱신할 때는 마지막 저장일부터만 받는다.
+# 주봉/월봉은 따로 받지 않고 일봉을 다시 묶어 만든다.
+OHLCV_STORE_PATH = DATA_DIR / "ohlcv.sqlite3"
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+OHLCV_HISTORY_YEARS = 10
+OHLCV_REFRESH_INTERVAL = 600   # 같은 종목의 꼬리를 다시 받는 최소 간격(초)
+OHLCV_FETCH_TIMEOUT = 15       # FinanceDataReader 요청 하나를 기다리는 최대 시간(초)
+OHLCV_RESAMPLE = {'week': 'W-FRI', 'month': 'ME'}
+
+class OhlcvStore(SqliteStore):
+    """일봉 저장소. 과거 봉은 추가만 하고, 장중에 바뀌는 마지막 봉만 덮어쓴다."""
+    schema = (
+        "CREATE TABLE IF NOT EXISTS ohlcv (ticker TEXT NOT NULL, date TEXT NOT NULL, open REAL, high REAL, low REAL, close REAL, volume REAL, PRIMARY KEY (ticker, date))",
+        "CREATE TABLE IF NOT EXISTS ohlcv_checks (ticker TEXT PRIMARY KEY, checked_at REAL NOT NULL)",
+    )
+
+    def last_date(self, ticker):
+        with self._connect() as conn:
+            row = conn.execute("SELECT MAX(date) FROM ohlcv WHERE ticker = ?", (ticker,)).fetchone()
+        return row[0] if row else None
+
+    def checked_at(self, ticker):
+        with self._connect() as conn:
+            row = conn.execute("SELECT checked_at FROM ohlcv_checks WHERE ticker = ?", (ticker,)).fetchone()
+        return row[0] if row else 0.0
+
+    def load(self, ticker, start=None):
+        """index=DatetimeIndex(date), columns=OHLCV_COLUMNS 인 일봉."""
+        with self._connect() as conn:
+            df = pd.read_sql_query("SELECT date, open, high, low, close, volume FROM ohlcv WHERE ticker = ? AND date >= ? ORDER BY date",
+                                   conn, params=(ticker, start or ''))
+        df['date'] = pd.to_datetime(df['date'])
+        return df.set_index('date').astype(float)
+
+    def append(self, ticker, daily):
+        rows = [(ticker, d.strftime('%Y-%m-%d'), *[None if pd.isna(v) else float(v) for v in values])
+                for d, values in zip(daily.index, daily[OHLCV_COLUMNS].to_numpy())]
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO ohlcv (ticker, date, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("INSERT OR REPLACE INTO ohlcv_checks (ticker, checked_at) VALUES (?, ?)", (ticker, time.time()))
+
+    def mark_checked(self, ticker):
+        """받은 봉이 없거나 실패했어도 확인 시각은 남겨 다음 갱신 간격까지 다시 묻지 않는다."""
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO ohlcv_checks (ticker, checked_at) VALUES (?, ?)", (ticker, time.time()))
+
+@st.cache_resource
+def get_ohlcv_store():
+    return OhlcvStore(OHLCV_STORE_PATH)
+
+def fetch_daily_bars(ticker, start):
+    """FinanceDataReader 일봉. 녹화/재생 모드에서는 fixtures/ohlcv/<종목>.csv 를 쓴다."""
+    path = fixture_dir() / "ohlcv" / f"{ticker}.csv"
+    if http_mode() == "replay":
+        if not path.exists(): return pd.DataFrame(columns=OHLCV_COLUMNS)
+        df = pd.read_csv(path, index_col=0, parse_dates=True)
+        return df[df.index >= pd.Timestamp(start)]
+    with span('fetch', 'ohlcv'):
+        df = bounded_call(fdr.DataReader, ticker, start, timeout=OHLCV_FETCH_TIMEOUT, name="fdr")
+    df = df.rename(columns=str.lower).reindex(columns=OHLCV_COLUMNS)
+    if http_mode() == "record":
+        path.parent.mkdir(parents=True, exist_ok=True)
+        df.to_csv(path)
+    return df
+
+def refresh_daily_bars(ticker, store=None, max_age=OHLCV_REFRESH_INTERVAL):
+    """마지막 확인 후 max_age 가 지났으면 마지막 저장일부터 다시 받아 붙인다. 실제로 받으러 갔으면 True.
+    받기는 OHLCV_FETCH_TIMEOUT 초까지만 기다리고, 넘기면 실패로 보고 max_age 동안 다시 묻지 않는다."""
+    store = store or get_ohlcv_store()
+    if time.time() - store.checked_at(ticker) <= max_age:
+        return False
+    last = store.last_date(ticker)
+    start = last or (datetime.now() - timedelta(days=365 * OHLCV_HISTORY_YEARS)).strftime('%Y-%m-%d')
+    try:
+        tail = fetch_daily_bars(ticker, start)
+        tail = tail.dropna(subset=['close'])
+    except Exception:
+        note_failure('ohlcv')
+        tail = pd.DataFrame()
+    if tail.empty: store.mark_checked(ticker)
+    else: store.append(ticker, tail)
+    return True
+
+def resample_ohlcv(daily, period):
+    """일봉을 주봉/월봉으로 묶는다. period 가 'day' 면 그대로."""
+    rule = OHLCV_RESAMPLE.get(period)
+    if rule is None or daily.empty: return daily
+    bars = daily.resample(rule).agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'})
+    return bars.dropna(subset=['close'])
+
+def lttb_indices(y, threshold):
+    """Largest-Triangle-Three-Buckets. 모양을 유지하며 고를 점의 위치(정수 배열)를 돌려준다."""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    x = np.arange(n, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    picked = np.empty(threshold, dtype=int)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+# --- 투자자 수급 이력 ---
+# frgn.naver 를 여러 페이지 동시에 받아 (종목, 날짜) 단위로 쌓는다. 다시 볼 때는 새 날짜와 모자란 과거만 받는다.
+INVESTOR_STORE_PATH = DATA_DIR / "investor.sqlite3"
+INVESTOR_HISTORY_DAYS = (60, 120, 250)
+INVESTOR_ROWS_PER_PAGE = 20
+INVESTOR_REFRESH_INTERVAL = CACHE_TTL['investor']
+INVESTOR_PAGE_WORKERS = 4
+INVESTOR_ROLLING = (5, 20, 60)
+INVESTOR_FLOW_COLUMNS = ['close', 'change_rate', 'inst_net', 'frgn_net', 'hold_rate']
+
+class InvestorFlowStore(SqliteStore):
+    """일별 기관/외국인 순매매 저장소. 같은 날짜는 마지막으로 받은 값으로 덮어쓴다."""
+    schema = (
+        "CREATE TABLE IF NOT EXISTS flows (ticker TEXT NOT NULL, date TEXT NOT NULL, close REAL, change_rate REAL, inst_net INTEGER, frgn_net INTEGER, hold_rate REAL, PRIMARY KEY (ticker, date))",
+        "CREATE TABLE IF NOT EXISTS flow_checks (ticker TEXT PRIMARY KEY, checked_at REAL NOT NULL)",
+        # 과거 페이지가 끝난(짧거나 빈 페이지를 받은) 종목. 신규 상장 종목의 없는 페이지를 다시 묻지 않는다.
+        "CREATE TABLE IF NOT EXISTS flow_history_ends (ticker TEXT PRIMARY KEY, ended_at REAL NOT NULL)",
+    )
+
+    def checked_at(self, ticker):
+        with self._connect() as conn:
+            row = conn.execute("SELECT checked_at FROM flow_checks WHERE ticker = ?", (ticker,)).fetchone()
+        return row[0] if row else 0.0
+
+    def history_ended(self, ticker):
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM flow_history_ends WHERE ticker = ?", (ticker,)).fetchone() is not None
+
+    def coverage(self, ticker):
+        """(저장된 날짜 수, 가장 최근 날짜)"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*), MAX(date) FROM flows WHERE ticker = ?", (ticker,)).fetchone()
+
+    def load(self, ticker, days):
+        """최근 days 거래일. index=DatetimeIndex(오름차순), columns=INVESTOR_FLOW_COLUMNS"""
+        with self._connect() as conn:
+            df = pd.read_sql_query(f"SELECT date, {', '.join(INVESTOR_FLOW_COLUMNS)} FROM flows WHERE ticker = ? ORDER BY date DESC LIMIT ?",
+                                   conn, params=(ticker, days))
+        df['date'] = pd.to_datetime(df['date'])
+        return df.set_index('date').sort_index()
+
+    def merge(self, ticker, days, history_ended=False):
+        """받은 날짜를 덮어쓰고 확인 시각을 남긴다. 받은 게 없어도 확인 시각은 갱신한다."""
+        rows = [(ticker, d.date.replace('.', '-'), d.close, d.change_rate, d.inst_net, d.frgn_net, d.hold_rate) for d in days]
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO flows (ticker, date, close, change_rate, inst_net, frgn_net, hold_rate) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("INSERT OR REPLACE INTO flow_checks (ticker, checked_at) VALUES (?, ?)", (ticker, time.time()))
+            if history_ended:
+                conn.execute("INSERT OR REPLACE INTO flow_history_ends (ticker, ended_at) VALUES (?, ?)", (ticker, time.time()))
+
+@st.cache_resource
+def get_investor_store():
+    return InvestorFlowStore(INVESTOR_STORE_PATH)
+
+@st.cache_resource
+def get_investor_page_executor():
+    return ThreadPoolExecutor(max_workers=INVESTOR_PAGE_WORKERS, thread_name_prefix="naver-frgn")
+
+def fetch_investor_pages(ticker, pages):
+    """여러 페이지를 동시에 받는다. {페이지: 행 목록}. 실패한 페이지는 빠진다."""
+    executor = get_investor_page_executor()
+    futures = {p: executor.submit(contextvars.copy_context().run, fetch_investor_page, ticker, p) for p in pages}
+    result = {}
+    for page, future in futures.items():
+        try: result[page] = future.result()
+        except Exception: note_failure('flows.page')
+    return result
+
+def fetch_investor_history(ticker, days, stored=0, last_date=None, history_ended=False):
+    """저장소에 없는 부분만 받는다. (행 목록, 과거 기록이 끝났는지) 반환.
+
+    머리(새 날짜)는 마지막 저장일 이후 영업일 수만큼의 페이지를 먼저 받고, 저장된 날짜와 겹칠 때까지만 한 장씩 더 넘긴다.
+    꼬리(과거)는 days 에 못 미칠 때만 받고, 짧거나 빈 페이지(기록의 끝)를 본 종목은 다시 받지 않는다.
+    """
+    per_page = INVESTOR_ROWS_PER_PAGE
+    pages_needed = -(-days // per_page)
+    rows = []
+    ended = False
+
+    def take(pages):
+        # 실패한 페이지는 got 에 없으므로 기록의 끝으로 보지 않는다. 200 인데 짧은 페이지만 끝이다.
+        nonlocal ended
+        got = fetch_investor_pages(ticker, pages)
+        for page in sorted(got):
+            rows.extend(got[page])
+            if len(got[page]) < per_page: ended = True
+        return got
+
+    if last_date is None:
+        take(range(1, pages_needed + 1))
+        return rows, ended
+
+    last = last_date.replace('-', '.')
+    gap = int(np.busday_count(np.datetime64(last_date), np.datetime64(datetime.now().date()))) + 1
+    page = min(pages_needed, max(1, -(-gap // per_page)))
+    got = take(range(1, page + 1))
+    while len(got) and not ended and page < pages_needed and not any(d.date <= last for d in rows):
+        page += 1
+        got = take([page])
+    new_days = sum(d.date > last for d in rows)
+
+    if stored < days and not history_ended and not ended:
+        first_missing = max(page + 1, (stored + new_days) // per_page + 1)
+        if first_missing <= pages_needed:
+            take(range(first_missing, pages_needed + 1))
+    return rows, ended
+
+def load_investor_flows(ticker, days=max(INVESTOR_HISTORY_DAYS), store=None):
+    """최근 days 거래일의 수급. INVESTOR_REFRESH_INTERVAL 안에 확인했으면 저장소만 읽는다."""
+    store = store or get_investor_store()
+    if time.time() - store.checked_at(ticker) > INVESTOR_REFRESH_INTERVAL:
+        stored, last_date = store.coverage(ticker)
+        try:
+            rows, ended = fetch_investor_history(ticker, days, stored, last_date, store.history_ended(ticker))
+        except Exception:
+            note_failure('flows')
+            rows, ended = [], False
+        store.merge(ticker, rows, ended)
+    return store.load(ticker, days)
+
+def sign_streak(values):
+    """부호가 같은 날이 연속된 길이 (순매수 +n, 순매도 -n, 0 이면 0)"""
+    sign = np.sign(np.asarray(values, dtype=float))
+    if not len(sign): return sign
+    starts = np.r_[True, sign[1:] != sign[:-1]]
+    start_index = np.flatnonzero(starts)[np.cumsum(starts) - 1]
+    return sign * (np.arange(len(sign)) - start_index + 1)
+
+def investor_flow_stats(flows):
+    """(요약 표, 누적 순매수 frame). 요약은 구간 합계와 현재 연속 순매수/순매도 일수. flows 는 비어 있지 않아야 한다.
+    값이 없는 날(NaN)은 합계/누적에서 빠진다 (0 으로 세지 않는다)."""
+    nets = flows[['inst_net', 'frgn_net']].astype(float).rename(columns={'inst_net': '기관', 'frgn_net': '외국인'})
+    summary = pd.DataFrame({f'{w}일 합계': nets.rolling(w, min_periods=1).sum().iloc[-1] for w in INVESTOR_ROLLING})
+    # 값이 없는 날은 연속 일수를 끊지도 세지도 않는다.
+    streaks = [sign_streak(nets[c].dropna().to_numpy()) for c in nets]
+    summary['연속(일)'] = [int(streak[-1]) if len(streak) else 0 for streak in streaks]
+    return summary, nets.cumsum()
+
+# 종목 화면 동시 수집 설정. 화면 전체 마감 시간(초)과 작업 스레드 수.
+PAGE_DEADLINE = 20
+SECTION_SOFT_DEADLINE = 2.5  # 이 시간 안에 못 온 섹션은 캐시의 이전 값(있으면)을 먼저 보여준다
+FETCH_WORKERS = 8
+
+@st.cache_resource
+def get_fetch_executor():
+    return ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="naver-fetch")
+
+class LazyNaverPage:
+    """여러 섹션이 동시에 요청해도 main.naver는 한 번만 받아서 파싱한다."""
+
+    def __init__(self, ticker):
+        self.ticker = ticker
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._soup = None
+        self._error = None
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        with self._lock:
+            if not self._loaded:
+                try: self._soup = fetch_naver_main(self.ticker)
+                except Exception as e: self._error = e
+                self._loaded = True
+        if self._error is not None:
+            raise self._error
+        return self._soup
+
+# 아래 load_* 함수들은 작업 스레드에서 돌기 때문에 st.* 를 호출하지 않는다. (값, 캐시상태) 반환.
+def load_quote(cache, page, ticker):
+    info, quote_status = cache.get_or_fetch('quote', ticker, lambda: extract_stock_details(page.get(), ticker))
+    overview, overview_status = cache.get_or_fetch(
+        'overview', ticker,
+        lambda: {'name': info.name, 'overview': extract_company_overview(page.get())},
+        cacheable=lambda v: bool(v['overview']))
+    if overview['overview']: info = replace(info, overview=overview['overview'])
+    missing = [k for k in ('per', 'eps', 'pbr', 'bps', 'dvr') if getattr(info, k) is None]
+    market = get_krx_market().peek()
+    if missing and market is not None:
+        # KRX 프레임은 예열/스크리너가 받아 둔 것만 본다. 여기서 받으면 시세 표시가 KRX 응답을 기다리게 된다.
+        fields = KrxBulkFundamentals(market).fields(ticker)
+        info = replace(info, **{k: fields[k] for k in missing if k in fields})
+    return info, {'quote': quote_status, 'overview': overview_status}
+
+def load_financials(cache, page, ticker):
+    value, status = cache.get_or_fetch('financials', ticker, lambda: load_financial_frames(ticker, page.get),
+                                       cacheable=lambda v: not (v[0].empty and v[1].empty))
+    return value, {'financials': status}
+
+def load_investor(cache, ticker):
+    value, status = cache.get_or_fetch('investor', ticker, lambda: get_investor_trend(ticker), cacheable=bool)
+    return value, {'investor': status}
+
+def load_flows(ticker):
+    return load_investor_flows(ticker), {}
+
+def load_chart(ticker):
+    """일봉 저장소만 갱신한다. 차트 조각은 저장소에서 바로 읽는다."""
+    refresh_daily_bars(ticker)
+    return True, {}
+
+def load_peers(cache, page, ticker):
+    def fetch():
+        try: return extract_industry_comparison(page.get())
+        except Exception:
+            note_failure('peers')
+            return pd.DataFrame()
+    value, status = cache.get_or_fetch('peers', ticker, fetch, cacheable=lambda v: not v.empty)
+    return value, {'peers': status}
+
+def submit_ticker_loads(ticker):
+    """종목 화면의 네 섹션 수집을 동시에 시작한다. {future: 섹션명} 반환."""
+    cache = get_ticker_cache()
+    executor = get_fetch_executor()
+    page = LazyNaverPage(ticker)
+    jobs = {
+        'quote': (load_quote, cache, page, ticker),
+        'financials': (load_financials, cache, page, ticker),
+        'investor': (load_investor, cache, ticker),
+        'flows': (load_flows, ticker),
+        'chart': (load_chart, ticker),
+        'peers': (load_peers, cache, page, ticker),
+    }
+    # 섹션마다 컨텍스트를 복사해 넘겨야 작업 스레드의 구간 기록이 현재 화면 트레이스에 붙는다.
+    return {executor.submit(contextvars.copy_context().run, run_in_section, section, *job): section
+            for section, job in jobs.items()}
+
+def load_stale(cache, ticker, section):
+    """섹션의 만료된 캐시 값과 저장 시각. 화면에 먼저 그려 둘 값이 없으면 None."""
+    kind = {'quote': 'quote', 'financials': 'financials', 'investor': 'investor', 'peers': 'peers'}[section]
+    entry = cache.peek(kind, ticker)
+    if entry is None: return None
+    value, fetched_at = entry
+    if section == 'quote':
+        overview = cache.peek('overview', ticker)
+        if overview and overview[0]['overview']: value = replace(value, overview=overview[0]['overview'])
+    return value, fetched_at
+
+def render_cache_status(status):
+    cache = get_ticker_cache()
+    labels = {'quote': "시세", 'overview': "기업개요", 'financials': "재무제표", 'investor': "매매동향", 'peers': "동일업종"}
+    rows = []
+    for kind, label in labels.items():
+        s = status.get(kind)
+        if s is None: continue
+        state = "STALE" if s.get('stale') else "HIT" if s['hit'] else "MISS"
+        rows.append({"데이터": label, "상태": state, "경과(초)": f"{s['age']:.0f}", "유효(초)": f"{cache.ttl.get(kind, 0):,}"})
+    with st.sidebar.expander("캐시 상태"):
+        st.table(pd.DataFrame(rows))
+        st.caption(f"전체 적중 {cache.hits} / 미적중 {cache.misses} · 보관 {len(cache)}/{cache.max_entries}")
+        prefetcher = get_prefetcher()
+        st.caption(f"예열 종목 {len(prefetcher.hot_tickers())}개 · 갱신 {sum(prefetcher.refreshes.values()):,}회")
+
+# --- S-RIM 스크리너 ---
+SCREENER_WORKERS = 6
+SCREENER_RATE = 8      # 네이버 요청 초당 허용량 (스크리너 전체 공유)
+SCREENER_BURST = 8
+
+@st.cache_resource
+def get_screener_limiter():
+    return RateLimiter(SCREENER_RATE, SCREENER_BURST)
+
+@st.cache_resource
+def get_screener_executor():
+    return ThreadPoolExecutor(max_workers=SCREENER_WORKERS, thread_name_prefix="screener")
+
+def srim_inputs(annual_df, quarter_df):
+    """S-RIM 입력값. 화면의 두 기준(최근 3년 평균 ROE, 최근 3분기 평균 ROE)과 같은 규칙으로 계산한다."""
+    def latest_bps(df):
+        if df.empty or 'bps' not in df: return 0.0
+        value = df['bps'].iloc[-1]
+        return 0.0 if pd.isna(value) else float(value)
+
+    def recent_roe(df, n):
+        if df.empty or 'roe' not in df: return 0.0
+        roe = df['roe']
+        roe = roe[roe.notna() & (roe != 0)].iloc[-n:]
+        return float(roe.mean()) if len(roe) else 0.0
+
+    return {
+        'bps': latest_bps(annual_df), 'roe_3y': recent_roe(annual_df, 3),
+        'bps_q': latest_bps(quarter_df), 'roe_3q': recent_roe(quarter_df, 3),
+        'roe_latest': recent_roe(annual_df, 1),
+    }
+
+def calculate_srim_vec(bps, roe, rrr):
+    """calculate_srim 의 벡터 버전. bps/roe 는 (종목,), rrr 은 (요구수익률,) -> (종목, 요구수익률) 배열."""
+    bps = np.asarray(bps, dtype=float)[:, None]
+    roe = np.asarray(roe, dtype=float)[:, None]
+    rrr = np.asarray(rrr, dtype=float)[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fair_value = bps + bps * ((roe - rrr) / 100) / (rrr / 100)
+    return np.where(rrr > 0, fair_value, 0.0)
+
+SENSITIVITY_RATE_STEP = 0.5
+
+def srim_sensitivity(inputs, rates):
+    """ROE 기준 3가지 × 요구수익률 격자의 적정주가를 한 번의 브로드캐스트로 계산한다."""
+    bases = [
+        ("3년 평균 ROE (연간)", inputs['bps'], inputs['roe_3y']),
+        ("3분기 평균 ROE (분기)", inputs['bps_q'], inputs['roe_3q']),
+        ("최근 연간 ROE", inputs['bps'], inputs['roe_latest']),
+    ]
+    labels, bps, roe = zip(*bases)
+    fair = calculate_srim_vec(bps, roe, rates)
+    return pd.DataFrame(np.where(fair > 0, fair, np.nan), index=list(labels), columns=list(rates)), list(roe)
+
+def load_screener_financials(cache, store, limiter, ticker):
+    """스크리너용 재무 수집. 메모리 캐시, 저장소 순으로 보고 오래된 종목만 요청 예산을 써서 네이버에 간다."""
+    def fetch_soup():
+        limiter.acquire()
+        return fetch_naver_main(ticker)
+    value, _ = cache.get_or_fetch('financials', ticker, lambda: load_financial_frames(ticker, fetch_soup, store),
+                                  cacheable=lambda v: not (v[0].empty and v[1].empty))
+    if value[0].empty and value[1].empty:
+        raise LookupError(f"{ticker} 재무 데이터 없음")
+    return srim_inputs(*value)
+
+def gather_srim_inputs(tickers, on_progress=None):
+    """종목별 BPS/ROE 를 제한된 동시성으로 모은다. index=종목코드 DataFrame 반환."""
+    cache = get_ticker_cache()
+    store = get_financial_store()
+    limiter = get_screener_limiter()
+    executor = get_screener_executor()
+    futures = {executor.submit(load_screener_financials, cache, store, limiter, t): t for t in tickers}
+    rows = {}
+    for done, future in enumerate(as_completed(futures), 1):
+        try: rows[futures[future]] = future.result()
+        except Exception: note_failure('screener')
+        if on_progress: on_progress(done, len(futures))
+    return pd.DataFrame.from_dict(rows, orient='index', columns=['bps', 'roe_3y', 'bps_q', 'roe_3q'])
+
+def evaluate_screener(universe, inputs, rates):
+    """universe(종목 목록)와 inputs(BPS/ROE)를 합쳐 요구수익률별 적정주가/괴리율을 한 번에 계산한다."""
+    df = universe.set_index('Code')[['Name', 'Market', 'Close']].join(inputs, how='inner')
+    fair = calculate_srim_vec(df['bps'].to_numpy(), df['roe_3y'].to_numpy(), rates)
+    price = df['Close'].to_numpy(dtype=float)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gap = np.where((fair > 0) & (price > 0), (price - fair) / fair * 100, np.nan)
+    result = pd.DataFrame({
+        '종목코드': df.index, '종목명': df['Name'].to_numpy(), '시장': df['Market'].to_numpy(),
+        '현재가': df['Close'].to_numpy(), 'BPS': df['bps'].to_numpy(), 'ROE': df['roe_3y'].round(2).to_numpy(),
+    })
+    for j, rate in enumerate(rates):
+        result[f'적정주가({rate:g}%)'] = np.where(fair[:, j] > 0, fair[:, j], np.nan).round(0)
+        result[f'괴리율({rate:g}%)'] = gap[:, j].round(1)
+    if 'source' in df:
+        result['출처'] = df['source'].fillna('').to_numpy()
+    for column, label in (('inst_net', '기관 순매수(억)'), ('frgn_net', '외국인 순매수(억)')):
+        if column in df and df[column].notna().any():
+            result[label] = (df[column] / 100000000).round(1).to_numpy()
+    return result
+
+# --- 일괄 데이터(KRX) ---
+# 시장 전체 PER/PBR/EPS/BPS/DIV 와 투자자별 순매수를 한 번의 요청으로 받아 종목별 값을 채운다.
+# pykrx 가 없거나 KRX 요청이 실패하면 빈 프레임이 되고, 그 종목은 네이버 스크래핑으로 넘어간다.
+KRX_LOOKBACK_DAYS = 7
+KRX_CACHE_TTL = 6 * 3600
+KRX_RETRY_INTERVAL = 600   # 받기에 실패(빈 프레임)했을 때 다시 시도하기까지(초)
+KRX_CALL_TIMEOUT = 10      # pykrx 요청 하나를 기다리는 최대 시간(초)
+KRX_INVESTORS = {'inst_net': '기관합계', 'frgn_net': '외국인'}
+KRX_COLUMNS = ['bps', 'per', 'pbr', 'eps', 'div', 'roe', 'inst_net', 'frgn_net']
+
+def krx_call(func, *args):
+    """pykrx 요청을 KRX_CALL_TIMEOUT 초까지만 기다린다. KrxMarket 잠금 안에서만 불려 한 번에 하나다."""
+    return bounded_call(func, *args, timeout=KRX_CALL_TIMEOUT, name="krx")
+
+def _krx_fundamental(date):
+    df = krx_call(krx.get_market_fundamental, date, "ALL")
+    if df is None or df.empty: return pd.DataFrame()
+    df = df.rename(columns=str.lower)[['bps', 'per', 'pbr', 'eps', 'div']].astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['roe'] = np.where(df['bps'] > 0, df['eps'] / df['bps'] * 100, np.nan)
+    return df
+
+def fetch_krx_market_frame():
+    """가장 최근 영업일의 시장 전체 지표. index=종목코드, columns=KRX_COLUMNS. 실패하면 빈 프레임."""
+    if krx is None:
+        return pd.DataFrame(columns=KRX_COLUMNS)
+    with span('fetch', 'krx'):
+        for back in range(KRX_LOOKBACK_DAYS):
+            date = (datetime.now() - timedelta(days=back)).strftime('%Y%m%d')
+            try: frame = _krx_fundamental(date)
+            except Exception:
+                note_failure('krx.fundamental')
+                break
+            if frame.empty: continue
+            for column, investor in KRX_INVESTORS.items():
+                try:
+                    flows = krx_call(krx.get_market_net_purchases_of_equities, date, date, "ALL", investor)
+                    frame[column] = flows['순매수거래대금'].reindex(frame.index).astype(float)
+                except Exception:
+                    note_failure('krx.investor')
+                    frame[column] = np.nan
+            frame.index = frame.index.astype(str).str.zfill(6)
+            frame.attrs['date'] = date
+            return frame[KRX_COLUMNS]
+    return pd.DataFrame(columns=KRX_COLUMNS)
+
+class KrxMarket:
+    """시장 전체 프레임을 프로세스에 하나 보관한다.
+
+    load() 는 오래됐을 때만 받고(동시에 부르면 한 번만), peek() 는 절대 받지 않고 지금 가진 값(없으면 None)만 준다.
+    종목 화면은 peek() 만 쓰고, 받기는 예열 스레드와 스크리너가 맡는다.
+    """
+
+    def __init__(self, fetch=fetch_krx_market_frame, ttl=KRX_CACHE_TTL, retry_interval=KRX_RETRY_INTERVAL):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._frame = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self):
+        if self._frame is None: return False
+        interval = self.ttl if not self._frame.empty else self.retry_interval
+        return time.time() - self._loaded_at < interval
+
+    def peek(self):
+        frame = self._frame
+        return frame if frame is not None and not frame.empty else None
+
+    def load(self):
+        with self._lock:
+            if not self._fresh():
+                frame = self._fetch()
+                # 실패했어도 예전 값이 있으면 그대로 쓴다.
+                if not frame.empty or self._frame is None: self._frame = frame
+                self._loaded_at = time.time()
+            return self._frame
+
+@st.cache_resource
+def get_krx_market():
+    return KrxMarket()
+
+def load_krx_market_frame():
+    return get_krx_market().load()
+
+class NaverFundamentals:
+    """종목별 메인 페이지를 긁어 S-RIM 입력값을 만든다. 3년 평균 ROE 를 쓰지만 종목 수만큼 요청한다."""
+    name = "네이버"
+
+    def frame(self, tickers, on_progress=None):
+        return gather_srim_inputs(tickers, on_progress)
+
+    def fields(self, ticker):
+        return {}
+
+class KrxBulkFundamentals:
+    """시장 전체 프레임 하나에서 값을 꺼낸다. ROE 는 최근 EPS/BPS 하나뿐이라 모든 ROE 기준에 같은 값을 쓴다."""
+    name = "KRX"
+
+    def __init__(self, market=None):
+        self._market = market
+
+    @property
+    def market(self):
+        if self._market is None: self._market = load_krx_market_frame()
+        return self._market
+
+    def frame(self, tickers, on_progress=None):
+        df = self.market.reindex([t for t in tickers if t in self.market.index])
+        df = df[df['bps'] > 0]
+        result = pd.DataFrame({
+            'bps': df['bps'], 'roe_3y': df['roe'], 'bps_q': df['bps'], 'roe_3q': df['roe'],
+            'inst_net': df['inst_net'], 'frgn_net': df['frgn_net'],
+        })
+        if on_progress: on_progress(len(tickers), len(tickers))
+        return result
+
+    def fields(self, ticker):
+        """StockQuote 투자지표 필드(per/eps/pbr/bps/dvr) 값. 없으면 빈 dict."""
+        if ticker not in self.market.index: return {}
+        row = self.market.loc[ticker]
+        return {key: float(row[column]) for key, column in (('per', 'per'), ('pbr', 'pbr'), ('eps', 'eps'), ('bps', 'bps'), ('dvr', 'div'))
+                if pd.notna(row[column]) and row[column] != 0}
+
+class FallbackFundamentals:
+    """primary 에 없는 종목만 fallback 으로 채운다. 어느 쪽에서 왔는지는 'source' 열에 남긴다."""
+
+    def __init__(self, primary, fallback):
+        self.primary, self.fallback = primary, fallback
+        self.name = f"{primary.name}+{fallback.name}"
+
+    def frame(self, tickers, on_progress=None):
+        first = self.primary.frame(tickers).assign(source=self.primary.name)
+        missing = [t for t in tickers if t not in first.index]
+        if not missing:
+            if on_progress: on_progress(len(tickers), len(tickers))
+            return first
+        offset = len(tickers) - len(missing)
+        progress = (lambda done, total: on_progress(offset + done, len(tickers))) if on_progress else None
+        rest = self.fallback.frame(missing, progress).assign(source=self.fallback.name)
+        return pd.concat([first, rest]) if not first.empty else rest
+
+    def fields(self, ticker):
+        return self.primary.fields(ticker) or self.fallback.fields(ticker)
+
+def fundamentals_provider(bulk=True):
+    """스크리너/상세 화면이 쓰는 재무 제공자. bulk 면 KRX 일괄 → 네이버 순, 아니면 네이버만."""
+    if bulk and krx is not None:
+        return FallbackFundamentals(KrxBulkFundamentals(), NaverFundamentals())
+    return NaverFundamentals()
+
+# --- 종목 비교 ---
+# 여러 종목의 시세/재무를 한꺼번에 모아 같은 축으로 맞춘다. 요청은 종목 화면과 같은 작업 풀·캐시를 쓴다.
+COMPARE_MAX = 30
+COMPARE_WORKERS = 3   # 비교는 종목이 많아 종목 화면 작업 풀과 따로 작은 풀을 쓴다
+FINANCIAL_LABELS = {key: label for label, key in FINANCIAL_ITEMS.items()}
+
+def load_comparison_row(cache, ticker):
+    page = LazyNaverPage(ticker)
+    info, _ = load_quote(cache, page, ticker)
+    frames, _ = load_financials(cache, page, ticker)
+    return info, frames
+
+@st.cache_resource
+def get_compare_executor():
+    return ThreadPoolExecutor(max_workers=COMPARE_WORKERS, thread_name_prefix="compare")
+
+def gather_comparison(tickers, on_progress=None):
+    """종목별 (시세, (연간, 분기)) 를 동시에 모은다. ({종목코드: 값}, [실패 종목]) 반환."""
+    cache = get_ticker_cache()
+    executor = get_compare_executor()
+    futures = {executor.submit(contextvars.copy_context().run, run_in_section, 'compare', load_comparison_row, cache, t): t
+               for t in tickers}
+    rows, failed = {}, []
+    try:
+        for done, future in enumerate(as_completed(futures, timeout=PAGE_DEADLINE), 1):
+            ticker = futures[future]
+            try: rows[ticker] = future.result()
+            except Exception:
+                note_failure('compare')
+                failed.append(ticker)
+            if on_progress: on_progress(done, len(futures))
+    except FuturesTimeout:
+        failed += [t for t in tickers if t not in rows and t not in failed]
+    return rows, failed
+
+def comparison_quotes(rows, names):
+    """종목별 시세 요약(숫자). index=종목명, 입력 순서 유지."""
+    return pd.DataFrame([{
+        '현재가': q.price, '등락률(%)': q.signed_change_rate, '시가총액(억)': q.market_cap, 'PER': q.per, 'PBR': q.pbr,
+        'EPS': q.eps, 'BPS': q.bps, '배당수익률(%)': q.dvr, '외국인비율(%)': q.foreign_rate,
+    } for q, _ in rows.values()], index=[names[t] for t in rows], dtype=float)
+
+def comparison_metric(rows, names, metric, quarterly=False):
+    """한 지표를 종목 × 기간 표로 맞춘다. 종목마다 없는 기간은 NaN."""
+    series = {names[t]: frames[1 if quarterly else 0][metric]
+              for t, (_, frames) in rows.items() if metric in frames[1 if quarterly else 0]}
+    if not series: return pd.DataFrame()
+    return pd.concat(series, axis=1).sort_index().T
+
+def comparison_srim(rows, names, rates):
+    """종목별 S-RIM 적정주가/괴리율. 스크리너와 같은 계산(evaluate_screener)을 쓴다."""
+    universe = pd.DataFrame([{'Code': t, 'Name': names[t], 'Market': '', 'Close': info.price_or_zero}
+                             for t, (info, _) in rows.items()])
+    inputs = pd.DataFrame.from_dict({t: srim_inputs(*frames) for t, (_, frames) in rows.items()}, orient='index')
+    if universe.empty: return pd.DataFrame()
+    return evaluate_screener(universe, inputs, rates).drop(columns=['시장'])
+
+# --- 백그라운드 예열 ---
+# 관심 종목(환경변수)과 많이 본 종목 상위 N개의 캐시를 만료 전에 미리 채워 둔다.
+PREFETCH_WATCHLIST_ENV = "STOCK_APP_WATCHLIST"  # 쉼표 구분 종목코드
+PREFETCH_TOP_N = 20
+PREFETCH_QUOTE_INTERVAL = CACHE_TTL['quote'] * 0.8
+PREFETCH_QUOTE_IDLE_INTERVAL = 1800  # 장 밖이면서 최근에 본 사람이 없는 종목의 시세 갱신 간격(초)
+PREFETCH_QUOTE_RECENT = 600          # 이 시간 안에 본 종목은 장 밖에서도 짧은 간격으로 시세를 갱신한다
+PREFETCH_INVESTOR_INTERVAL = CACHE_TTL['investor'] * 0.8
+PREFETCH_FINANCIALS_INTERVAL = CACHE_TTL['financials'] * 0.5
+PREFETCH_OHLCV_INTERVAL = OHLCV_REFRESH_INTERVAL * 0.8
+PREFETCH_RATE = 3                 # 예열 전체의 초당 요청 예산
+PREFETCH_TICK = 1.0
+PREFETCH_VIEW_DECAY = 3600        # 조회수를 이 주기마다 절반으로 줄여 최근 인기 종목을 따른다
+KST = timezone(timedelta(hours=9))
+KRX_SESSION = ((9, 0), (15, 30))  # 정규장 (시, 분), 한국 시간. 공휴일은 따지지 않는다
+
+def krx_session_open(now=None):
+    """지금이 평일 정규장 시간인지 (한국 시간)"""
+    now = now or datetime.now(KST)
+    return now.weekday() < 5 and KRX_SESSION[0] <= (now.hour, now.minute) < KRX_SESSION[1]
+
+class Prefetcher:
+    """백그라운드 스레드에서 인기 종목의 시세/재무/매매동향 캐시를 주기적으로 갱신한다."""
+
+    def __init__(self, cache, store, limiter, watchlist=(), top_n=PREFETCH_TOP_N):
+        self.cache = cache
+        self.store = store
+        self.limiter = limiter
+        self.watchlist = list(watchlist)
+        self.top_n = top_n
+        self.views = Counter()
+        self.viewed_at = {}
+        self.refreshes = Counter()
+        self._last = {}
+        self._last_decay = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def record_view(self, ticker):
+        with self._lock:
+            self.views[ticker] += 1
+            self.viewed_at[ticker] = time.time()
+
+    def hot_tickers(self):
+        with self._lock:
+            if time.time() - self._last_decay > PREFETCH_VIEW_DECAY:
+                self.views = Counter({t: n // 2 for t, n in self.views.items() if n // 2})
+                self.viewed_at = {t: at for t, at in self.viewed_at.items() if time.time() - at < PREFETCH_QUOTE_RECENT}
+                self._last_decay = time.time()
+            popular = [t for t, _ in self.views.most_common(self.top_n)]
+        return list(dict.fromkeys(self.watchlist + popular))
+
+    def _due(self, kind, ticker, interval, now):
+        return now - self._last.get((kind, ticker), 0) >= interval
+
+    def quote_interval(self, ticker, now):
+        """시세는 장중이거나 최근에 누가 본 종목만 캐시 만료 전에 갱신한다. 그 밖에는 값이 바뀌지 않으므로 드물게."""
+        with self._lock: viewed_at = self.viewed_at.get(ticker, 0)
+        if krx_session_open() or now - viewed_at < PREFETCH_QUOTE_RECENT:
+            return PREFETCH_QUOTE_INTERVAL
+        return PREFETCH_QUOTE_IDLE_INTERVAL
+
+    def _run(self):
+        while not self._stop.wait(PREFETCH_TICK):
+            if krx is not None:
+                try: get_krx_market().load()
+                except Exception: logger.debug("prefetch failed for KRX market", exc_info=True)
+            for ticker in self.hot_tickers():
+                if self._stop.is_set(): return
+                try: self.refresh(ticker)
+                except Exception: logger.debug("prefetch failed for %s", ticker, exc_info=True)
+
+    def refresh(self, ticker):
+        now = time.time()
+        page = LazyNaverPage(ticker)
+        if self._due('quote', ticker, self.quote_interval(ticker, now), now):
+            # main.naver 한 번으로 시세/기업개요/동일업종을 함께 채운다.
+            self.limiter.acquire()
+            soup = page.get()
+            if soup is not None:
+                info = extract_stock_details(soup, ticker)
+                self.cache.put('quote', ticker, info)
+                overview = extract_company_overview(soup)
+                if overview: self.cache.put('overview', ticker, {'name': info.name, 'overview': overview})
+                peers = extract_industry_comparison(soup)
+                if not peers.empty: self.cache.put('peers', ticker, peers)
+            self._last[('quote', ticker)] = now
+            self.refreshes['quote'] += 1
+        if self._due('financials', ticker, PREFETCH_FINANCIALS_INTERVAL, now):
+            # 저장소가 신선하면 네트워크 없이 채워지고, 오래됐을 때만 (이미 받은) 페이지를 쓴다.
+            def fetch_soup():
+                if not page.loaded: self.limiter.acquire()
+                return page.get()
+            frames = load_financial_frames(ticker, fetch_soup, self.store)
+            if not (frames[0].empty and frames[1].empty): self.cache.put('financials', ticker, frames)
+            self._last[('financials', ticker)] = now
+            self.refreshes['financials'] += 1
+        if self._due('investor', ticker, PREFETCH_INVESTOR_INTERVAL, now):
+            self.limiter.acquire()
+            trends = get_investor_trend(ticker)
+            if trends: self.cache.put('investor', ticker, trends)
+            self._last[('investor', ticker)] = now
+            self.refreshes['investor'] += 1
+        if self._due('ohlcv', ticker, PREFETCH_OHLCV_INTERVAL, now):
+            # 일봉 저장소를 화면의 갱신 간격보다 먼저 채워 차트 섹션이 네트워크 없이 끝나게 한다.
+            self.limiter.acquire()
+            refresh_daily_bars(ticker, max_age=PREFETCH_OHLCV_INTERVAL)
+            self._last[('ohlcv', ticker)] = now
+            self.refreshes['ohlcv'] += 1
+
+@st.cache_resource
+def get_prefetcher():
+    watchlist = [t for t in re.split(r'[\s,]+', os.environ.get(PREFETCH_WATCHLIST_ENV, "")) if t]
+    return Prefetcher(get_ticker_cache(), get_financial_store(), RateLimiter(PREFETCH_RATE), watchlist).start()
+
+if 'search_key' not in st.session_state:
+    st.session_state.search_key = 0 
+
+def reset_search_state():
+    """이 사용자의 화면 상태만 초기화한다. 프로세스 공용 캐시(목록/시세/재무)는 건드리지 않는다."""
+    for key in list(st.session_state):
+        if key != 'search_key': del st.session_state[key]
+    st.session_state.search_key += 1 
+
+# --- 메인 UI ---
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda f: f)
+
+def render_diagnostics(trace):
+    """?diag=1 로 열었을 때만 보이는 진단 패널: 이번 렌더링의 구간 폭포 차트, 카운터, 전체 사용자 p50/p95."""
+    record = trace.to_dict()
+    total = record['total'] or 1e-9
+    colors = {'fetch': '#5b8def', 'parse': '#f2a93b', 'extract': '#8e6fd8', 'render': '#03C75A'}
+    bars = ""
+    for sp in sorted(record['spans'], key=lambda x: x['start']):
+        left = sp['start'] / total * 100
+        width = max(sp['duration'] / total * 100, 0.3)
+        color = '#d20000' if sp['error'] else colors.get(sp['stage'], '#999')
+        bars += (f'<div style="display:flex; align-items:center; font-size:11px; height:18px;">'
+                 f'<div style="width:34%; white-space:nowrap; overflow:hidden;">{sp["section"]} · {sp["stage"]}</div>'
+                 f'<div style="position:relative; width:52%; height:10px; background:rgba(128,128,128,0.1);">'
+                 f'<div style="position:absolute; left:{left:.2f}%; width:{width:.2f}%; height:100%; background:{color};"></div></div>'
+                 f'<div style="width:14%; text-align:right;">{sp["duration"] * 1000:.0f}ms</div></div>')
+    with st.sidebar.expander("🩺 진단", expanded=True):
+        st.caption(f"{record['name']} · 전체 {total * 1000:.0f}ms · 구간 {len(record['spans'])}개")
+        st.markdown(bars or "기록된 구간이 없습니다.", unsafe_allow_html=True)
+        if record['counters']:
+            st.table(pd.DataFrame(sorted(record['counters'].items()), columns=["카운터", "값"]))
+        render_http_stats(get_http_client())
+        summary = get_trace_aggregator().summary()
+        if not summary.empty:
+            st.markdown("*최근 렌더링 집계 (전체 사용자)*")
+            st.dataframe(summary, hide_index=True, use_container_width=True)
+        st.download_button("JSON 내려받기", json.dumps(record, ensure_ascii=False, indent=1), file_name=f"trace_{record['name']}.json", mime="application/json")
+
+def render_http_stats(client):
+    """프로세스 전체의 외부 요청 묶음/속도 제한 누적치."""
+    flights = client.flights.stats()
+    st.markdown("*외부 요청 (프로세스 전체)*")
+    st.caption(f"실제 요청 {flights['leaders']:,}회 · 묶임 {flights['coalesced']:,}회 "
+               f"(대기 합계 {flights['wait_total']:.1f}초) · 진행 중 {flights['in_flight']}건")
+    rows = [{"호스트": host, "요청": s['acquired'], "대기": s['throttled'], "거절": s['rejected'], "대기 중": s['waiting'],
+             "평균 대기(ms)": round(s['wait_total'] / s['throttled'] * 1000) if s['throttled'] else 0,
+             "최대 대기(ms)": round(s['wait_max'] * 1000)}
+            for host, s in client.host_stats().items()]
+    if rows:
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+
+def render_stock_header(info, ticker):
+    st.markdown(f"### {info.name} ({ticker})")
+    
+    diff_color = "black"
+    diff_arrow = ""
+    if info.direction in ['up', 'upper']:
+        diff_color = "#d20000"
+        diff_arrow = "▲"
+    elif info.direction in ['down', 'lower']:
+        diff_color = "#0051c7"
+        diff_arrow = "▼"
+    
+    st.markdown(f"""
+    <div style="display:flex; align-items:flex-end; gap:10px; margin-bottom:10px;">
+        <span style="font-size: 2.5rem; font-weight: bold; color:{diff_color};">{fmt_number(info.price)}</span>
+        <span style="font-size: 1.2rem; color:{diff_color}; margin-bottom: 8px;">
+            {diff_arrow} {fmt_number(info.change)} ({fmt_number(info.change_rate, '{:.2f}')}%)
+        </span>
+    </div>
+    """, unsafe_allow_html=True)
+
+    info_html = f"""
+    <div class="stock-info-container">
+        <div class="stock-info-box"><div class="stock-info-label">시가총액</div><div class="stock-info-value">{fmt_market_cap(info.market_cap)}</div></div>
+        <div class="stock-info-box"><div class="stock-info-label">외국인소진율</div><div class="stock-info-value">{fmt_number(info.foreign_rate, '{:.2f}%')}</div></div>
+        <div class="stock-info-box"><div class="stock-info-label">PER</div><div class="stock-info-value">{fmt_number(info.per, '{:,.2f}')} 배</div></div>
+        <div class="stock-info-box"><div class="stock-info-label">PBR</div><div class="stock-info-value">{fmt_number(info.pbr, '{:,.2f}')} 배</div></div>
+        <div class="stock-info-box"><div class="stock-info-label">52주 최고</div><div class="stock-info-value">{fmt_number(info.high_52)}</div></div>
+        <div class="stock-info-box"><div class="stock-info-label">52주 최저</div><div class="stock-info-value">{fmt_number(info.low_52)}</div></div>
+        <div class="stock-info-box"><div class="stock-info-label">EPS</div><div class="stock-info-value">{fmt_number(info.eps)} 원</div></div>
+        <div class="stock-info-box"><div class="stock-info-label">배당수익률</div><div class="stock-info-value">{fmt_number(info.dvr, '{:.2f}')} %</div></div>
+    </div>
+    """
+    st.markdown(info_html, unsafe_allow_html=True)
+
+    with st.expander("기업 개요 보기"):
+        st.write(info.overview)
+
+    st.markdown(f"""
+        <a href="https://m.stock.naver.com/item/main.nhn?code={ticker}#/chart" target="_blank" style="text-decoration:none;">
+            <div style="background-color:#03C75A; color:white; padding:12px; border-radius:8px; text-align:center; font-weight:bold; margin: 15px 0;">
+                📊 네이버 증권 차트 보러가기
+            </div>
+        </a>
+        """, unsafe_allow_html=True)
+    
+
+CHART_RANGES = {"3개월": 92, "1년": 365, "3년": 3 * 365, "10년": 10 * 365}
+CHART_MAX_POINTS = 500  # 이보다 봉이 많으면 종가 선 그래프로 바꾸고 LTTB 로 줄여 보낸다
+
+def build_price_chart(bars):
+    """봉 수가 적으면 캔들+거래량, 많으면 LTTB 로 줄인 종가 선 그래프."""
+    data = bars.reset_index().rename(columns={bars.index.name or 'index': 'date'})
+    if len(data) > CHART_MAX_POINTS:
+        data = data.iloc[lttb_indices(data['close'].to_numpy(), CHART_MAX_POINTS)]
+        return alt.Chart(data).mark_line().encode(
+            x=alt.X('date:T', title=None), y=alt.Y('close:Q', title=None, scale=alt.Scale(zero=False)),
+            tooltip=[alt.Tooltip('date:T', title='날짜'), alt.Tooltip('close:Q', title='종가', format=',.0f')])
+
+    up = alt.condition('datum.open <= datum.close', alt.value('#d62728'), alt.value('#1f77b4'))
+    base = alt.Chart(data).encode(x=alt.X('date:T', title=None))
+    tooltip = [alt.Tooltip('date:T', title='날짜')] + [alt.Tooltip(f'{c}:Q', title=t, format=',.0f') for c, t in
+                                                       (('open', '시가'), ('high', '고가'), ('low', '저가'), ('close', '종가'), ('volume', '거래량'))]
+    wick = base.mark_rule().encode(y=alt.Y('low:Q', title=None, scale=alt.Scale(zero=False)), y2='high:Q', color=up)
+    body = base.mark_bar().encode(y='open:Q', y2='close:Q', color=up, tooltip=tooltip)
+    volume = base.mark_bar().encode(y=alt.Y('volume:Q', title=None, axis=alt.Axis(format='~s')), color=up).properties(height=80)
+    return alt.vconcat((wick + body).properties(height=300), volume, spacing=4)
+
+@_fragment
+def render_stock_chart(ticker):
+    """FinanceDataReader 일봉으로 그린 차트. 주기/기간을 바꾸면 이 부분만 다시 실행된다.
+
+    일봉을 얻지 못하면 선택한 주기의 네이버 차트 이미지를 대신 보여준다.
+    """
+    c1, c2 = st.columns([1, 1])
+    with c1: label = st.radio("차트", list(CHART_PERIODS), horizontal=True, key="chart_period", label_visibility="collapsed")
+    with c2: window = st.select_slider("기간", list(CHART_RANGES), value="1년", key="chart_range", label_visibility="collapsed")
+    period = CHART_PERIODS[label]
+    daily = get_ohlcv_store().load(ticker)  # 갱신은 차트 섹션 작업이 맡고, 조각 재실행은 저장소만 읽는다
+    if not daily.empty:
+        start = daily.index[-1] - pd.Timedelta(days=CHART_RANGES[window])
+        st.altair_chart(build_price_chart(resample_ohlcv(daily[daily.index >= start], period)), use_container_width=True)
+        return
+    image = get_chart_cache().get(ticker, period)
+    if image: st.image(image, use_container_width=True)
+    else: st.caption("차트를 불러오지 못했습니다.")
+
+def signed_class(values):
+    """부호에 따른 글자색 클래스 (양수 빨강, 음수 파랑)"""
+    return np.select([values > 0, values < 0], ["text-red", "text-blue"], "text-black")
+
+def format_signed(values):
+    """정수값 배열을 +1,234 / -1,234 / 0 형태 문자열로. NaN(값 없음)은 '-'"""
+    text = pd.Series(np.abs(values)).map('{:,.0f}'.format, na_action='ignore').fillna('-').to_numpy(dtype=object)
+    return np.select([values > 0, values < 0], ["+" + text, "-" + text], text)
+
+def nan_total(values):
+    """값 없음(NaN)을 빼고 더한다. 전부 없으면 NaN."""
+    return np.array([np.nansum(values) if not np.isnan(values).all() else np.nan])
+
+def investor_trend_html(investor_trends):
+    df = pd.DataFrame({
+        'date': [r.date for r in investor_trends], 'close': [r.close for r in investor_trends],
+        'rate': [r.change_rate for r in investor_trends], 'inst': [r.inst_net for r in investor_trends],
+        'frgn': [r.frgn_net for r in investor_trends], 'hold': [r.hold_rate for r in investor_trends],
+    })
+    inst, frgn = df['inst'].astype(float).to_numpy(), df['frgn'].astype(float).to_numpy()
+    rate = df['rate'].astype(float).to_numpy()
+    total_inst, total_frgn = nan_total(inst), nan_total(frgn)
+    rate_text = np.where(np.isnan(rate), '-', np.where(rate != 0, df['rate'].map('{:+.2f}%'.format, na_action='ignore'), '0.00%'))
+    close_text = df['close'].map('{:,.0f}'.format, na_action='ignore').fillna('-')
+    hold_text = df['hold'].map('{:.2f}%'.format, na_action='ignore').fillna('-')
+
+    rows = (
+        '<tr><td style="text-align:center;">' + df['date'] + '</td><td style="text-align:right;">' + close_text
+        + '</td><td class="' + signed_class(np.nan_to_num(rate)) + '" style="text-align:right;">' + rate_text
+        + '</td><td class="' + signed_class(inst) + '" style="text-align:right;">' + format_signed(inst)
+        + '</td><td class="' + signed_class(frgn) + '" style="text-align:right;">' + format_signed(frgn)
+        + '</td><td style="text-align:right;">' + hold_text + '</td></tr>'
+    )
+    total = (f'<tr class="total-row"><td style="text-align:center;">10일 합계</td><td colspan="2" style="text-align:center;">-</td>'
+             f'<td class="{signed_class(total_inst)[0]}">{format_signed(total_inst)[0]}</td>'
+             f'<td class="{signed_class(total_frgn)[0]}">{format_signed(total_frgn)[0]}</td><td>-</td></tr>')
+    return ('<div style="overflow-x:auto;">\n<table class="trend-table">\n'
+            '<thead><tr><th>날짜</th><th>종가</th><th>등락률</th><th>기관</th><th>외국인</th><th>보유율</th></tr></thead>\n<tbody>\n'
+            + total + ''.join(rows) + '</tbody></table></div>')
+
+def render_investor_trend(investor_trends, cache_key=None):
+    if investor_trends:
+        st.markdown("### 🏢 외국인/기관 매매동향 (최근 10일)")
+        st.markdown(cached_html(cache_key, lambda: investor_trend_html(investor_trends)), unsafe_allow_html=True)
+
+@_fragment
+def render_investor_flows(flows):
+    """수급 이력 요약과 누적 순매수 차트. 기간을 바꾸면 이 부분만 다시 그린다."""
+    if flows.empty: return
+    st.markdown("#### 📈 기관/외국인 수급 추이")
+    windows = [d for d in INVESTOR_HISTORY_DAYS if d <= len(flows)] or [len(flows)]
+    days = st.radio("기간", windows, index=len(windows) - 1, horizontal=True, format_func=lambda d: f"{d}일", key="flow_days")
+    summary, cumulative = investor_flow_stats(flows.tail(days))
+    st.dataframe(summary.style.format('{:+,.0f}', na_rep='-'), use_container_width=True)
+    st.caption("단위: 주 · 연속(일): 양수면 연속 순매수, 음수면 연속 순매도")
+    data = cumulative.reset_index().melt('date', var_name='투자자', value_name='누적 순매수')
+    chart = alt.Chart(data).mark_line().encode(
+        x=alt.X('date:T', title=None), y=alt.Y('누적 순매수:Q', title=None, axis=alt.Axis(format='~s')),
+        color=alt.Color('투자자:N', scale=alt.Scale(domain=['기관', '외국인'], range=['#ff7f0e', '#1f77b4'])),
+        tooltip=[alt.Tooltip('date:T', title='날짜'), '투자자:N', alt.Tooltip('누적 순매수:Q', format=',.0f')])
+    st.altair_chart(chart, use_container_width=True)
+
+# 모든 화면이 쓰는 스타일. 실행마다 문자열을 새로 만들지 않고 이 상수를 한 번만 내보낸다.
+APP_CSS = """
+<style>
+.scroll-table { overflow-x: auto; white-space: nowrap; margin-bottom: 10px; }
+.scroll-table table { width: 100%; border-collapse: collapse; font-size: 0.9rem; }
+.scroll-table th { text-align: center; padding: 8px; border-bottom: 1px solid #ddd; min-width: 80px; background-color: #f0f2f6; color: #000; }
+.scroll-table td { text-align: right; padding: 8px; border-bottom: 1px solid #ddd; }
+.scroll-table th:first-child, .scroll-table td:first-child { position: sticky; left: 0; z-index: 10; border-right: 2px solid #ccc; text-align: left; font-weight: bold; background-color: #ffffff; color: #000000; }
+.trend-table { width: 100%; border-collapse: collapse; font-size: 0.85rem; margin-bottom: 20px; }
+.trend-table th { background-color: rgba(128,128,128,0.1); text-align: center; padding: 6px; border-bottom: 1px solid rgba(128,128,128,0.2); }
+.trend-table td { text-align: right; padding: 6px; border-bottom: 1px solid rgba(128,128,128,0.2); }
+.total-row { background-color: rgba(128, 128, 128, 0.05); font-weight: bold; border-bottom: 2px solid rgba(128, 128, 128, 0.4); }
+.text-red { color: #d20000; }
+.text-blue { color: #0051c7; }
+.text-black { color: inherit; }
+.stock-info-container { display: grid; grid-template-columns: repeat(4, 1fr); gap: 8px; margin-top: 10px; margin-bottom: 20px; }
+@media (max-width: 600px) { .stock-info-container { grid-template-columns: repeat(2, 1fr); } }
+.stock-info-box { background-color: rgba(128, 128, 128, 0.1); padding: 10px; border-radius: 5px; text-align: center; }
+.stock-info-label { font-size: 12px; color: #666; margin-bottom: 4px; }
+.stock-info-value { font-size: 15px; font-weight: bold; color: #333; white-space: nowrap; }
+.skeleton { margin: 8px 0 18px; }
+.skeleton .bar { height: 14px; margin: 8px 0; border-radius: 4px; background: linear-gradient(90deg, #eee 25%, #f6f6f6 50%, #eee 75%); background-size: 200% 100%; animation: skeleton 1.2s infinite; }
+.skeleton .title { height: 22px; width: 40%; }
+.stale-badge { display: inline-block; padding: 2px 8px; border-radius: 10px; font-size: 0.8rem; background: #fff3cd; color: #856404; margin-bottom: 4px; }
+@keyframes skeleton { from { background-position: 200% 0; } to { background-position: -200% 0; } }
+@media (prefers-color-scheme: dark) {
+    .text-black { color: #fff; }
+    .stock-info-label { color: #aaa; } .stock-info-value { color: #fff; }
+    .skeleton .bar { background: linear-gradient(90deg, #262730 25%, #33343f 50%, #262730 75%); background-size: 200% 100%; }
+    .scroll-table th { background-color: #262730; color: #fff; border-bottom: 1px solid #444; }
+    .scroll-table td { border-bottom: 1px solid #444; color: #fff; }
+    .scroll-table th:first-child, .scroll-table td:first-child { background-color: #0e1117; color: #fff; border-right: 2px solid #555; }
+}
+</style>
+"""
+
+def render_styles():
+    st.markdown(APP_CSS, unsafe_allow_html=True)
+
+# --- 완성된 HTML 조각 캐시 ---
+# (섹션, 종목, 데이터 버전, ...) 이 같으면 표를 다시 포맷하지 않는다. 데이터 버전은 TickerCache 저장 시각.
+FRAGMENT_CACHE_MAX = 512
+
+class FragmentCache:
+    """문자열 조각 LRU. 여러 세션이 공유한다."""
+
+    def __init__(self, max_entries=FRAGMENT_CACHE_MAX):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+        if html is not None:
+            count('fragment.hit')
+            return html
+        count('fragment.miss')
+        html = build()
+        with self._lock:
+            self._entries[key] = html
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+@st.cache_resource
+def get_fragment_cache():
+    return FragmentCache()
+
+def memo_key(*parts):
+    """조각 캐시 키. 버전을 모르는 값(None)이 하나라도 있으면 캐시하지 않는다."""
+    return None if any(p is None for p in parts) else parts
+
+def cached_html(key, build):
+    return build() if key is None else get_fragment_cache().get_or_build(key, build)
+
+def render_skeleton(label, rows=3):
+    bars = ''.join(f'<div class="bar" style="width:{90 - i * 12}%"></div>' for i in range(rows))
+    st.markdown(f'<div class="skeleton"><div class="bar title"></div>{bars}</div>', unsafe_allow_html=True)
+    st.caption(f"{label} 불러오는 중...")
+
+def render_stale_badge(fetched_at):
+    minutes = max(0, int((time.time() - fetched_at) // 60))
+    st.markdown(f'<span class="stale-badge">🕒 이전 데이터 · {minutes}분 전 · 새로 고치는 중</span>', unsafe_allow_html=True)
+
+def refill(slot):
+    """st.empty 자리를 비우고 새 컨테이너를 돌려준다. 같은 종류의 블록을 덮어쓰면 이전 자식이 남으므로 먼저 비운다."""
+    slot.empty()
+    return slot.container()
+
+FINANCIAL_TABLE_ROWS = [
+    ("매출액(억)", 'revenue'), ("영업이익(억)", 'op_income'), ("영업이익률(%)", 'op_margin'),
+    ("당기순이익(억)", 'net_income'), ("순이익률(%)", 'net_income_margin'),
+    ("부채비율(%)", 'debt_ratio'), ("당좌비율(%)", 'quick_ratio'), ("유보율(%)", 'reserve_ratio'),
+    ("EPS(원)", 'eps'), ("BPS(원)", 'bps'), ("SPS(원)", 'sps'),
+    ("PER(배)", 'per'), ("PBR(배)", 'pbr'), ("PSR(배)", 'psr'),
+    ("ROE(%)", 'roe')
+]
+
+def financial_table_html(frame):
+    """apply_price_ratios 를 거친 재무 DataFrame 을 표 HTML 로. 지표(열)마다 한 번에 포맷한다.
+
+    값이 없거나 0 이면 '-' (영업이익/순이익의 0 은 그대로 0).
+    """
+    columns = {}
+    for label, key in FINANCIAL_TABLE_ROWS:
+        values = frame[key].fillna(0.0) if key in frame else pd.Series(0.0, index=frame.index)
+        text = values.map(('{:,.0f}' if '원' in label or '억' in label else '{:,.2f}').format)
+        if key not in ('op_income', 'net_income'): text = text.where(values != 0, '-')
+        columns[label] = text
+    table = pd.DataFrame(columns).T
+    table.columns = list(frame.index)
+    table = table.rename_axis('항목').reset_index()
+    return f'<div class="scroll-table">{table.to_html(index=False, border=0, classes="scroll-table-content")}</div>'
+
+def render_financial_tables(annual_df, quarter_df, cache_key=None):
+    if not annual_df.empty:
+        st.markdown("### 📊 연간 재무제표 (최근 3년)")
+        st.markdown(cached_html(cache_key and cache_key + ('annual',), lambda: financial_table_html(annual_df)), unsafe_allow_html=True)
+
+    if not quarter_df.empty:
+        st.markdown("### 📊 분기 재무제표 (최근 5분기)")
+        st.markdown(cached_html(cache_key and cache_key + ('quarter',), lambda: financial_table_html(quarter_df)), unsafe_allow_html=True)
+
+    if annual_df.empty and quarter_df.empty:
+        st.warning("재무 데이터를 불러올 수 없습니다.")
+
+def industry_comparison_html(industry_compare_df):
+    html_compare = industry_compare_df.to_html(index=False, border=0, classes='scroll-table-content', escape=False)
+    return f'<div class="scroll-table">{html_compare}</div>'
+
+def render_industry_comparison(industry_compare_df, cache_key=None):
+    if not industry_compare_df.empty:
+        st.markdown("### 👯 동일업종 비교")
+        st.markdown(cached_html(cache_key, lambda: industry_comparison_html(industry_compare_df)), unsafe_allow_html=True)
+
+def render_srim(annual_list, quarter_list, curr_price, required_return):
+    st.divider()
+    st.markdown("### 💰 S-RIM 적정주가 분석")
+
+    def show_srim_result(title, bps, roe_used, label_roe, roe_list=None):
+        val = calculate_srim(bps, roe_used, required_return)
+        excess_rate = roe_used - required_return
+        
+        st.markdown(f"#### {title}")
+        if val > 0 and curr_price > 0:
+            diff_rate = (curr_price - val) / val * 100
+            diff_abs = abs(diff_rate)
+            if val > curr_price:
+                st.success(f"현재가({curr_price:,.0f}원)는 적정주가({val:,.0f}원) 대비 **{diff_abs:.1f}% 저평가** 상태입니다.")
+            else:
+                st.error(f"현재가({curr_price:,.0f}원)는 적정주가({val:,.0f}원) 대비 **{diff_abs:.1f}% 고평가** 상태입니다.")
+        else:
+            st.warning("적정주가를 산출할 수 없습니다.")
+
+        st.markdown("**🧮 산출 근거**")
+        c1, c2 = st.columns(2)
+        with c1:
+            st.markdown("*핵심 변수*")
+            input_df = pd.DataFrame({"구분": ["BPS", f"적용 ROE ({label_roe})"], "값": [f"{bps:,.0f} 원", f"{roe_used:.2f} %"]})
+            st.table(input_df)
+        with c2:
+            st.markdown("*ROE 내역*")
+            if roe_list:
+                roe_df = pd.DataFrame(roe_list)
+                roe_df['ROE'] = roe_df['ROE'].apply(lambda x: f"{x:.2f} %")
+                st.table(roe_df)
+            else:
+                st.write(f"적용 ROE: {roe_used:.2f}%")
+
+        with st.info("계산식"):
+            st.markdown(f"**① 초과이익률** = {roe_used:.2f}% (ROE) - {required_return}% (요구수익률) = **{excess_rate:.2f}%**")
+            st.markdown(f"**② 적정주가** = {bps:,.0f} (BPS) + ( {bps:,.0f} × {excess_rate:.2f}% ÷ {required_return}% ) ≈ **{val:,.0f} 원**")
+
+    if annual_list:
+        bps_annual = annual_list[-1].get('bps', 0)
+        roe_history_annual = []
+        for d in annual_list:
+            if d.get('roe'): roe_history_annual.append({'연도': d['date'], 'ROE': d['roe']})
+        
+        roe_history_annual_3yr = roe_history_annual[-3:]
+        avg_roe_annual = sum([r['ROE'] for r in roe_history_annual_3yr]) / len(roe_history_annual_3yr) if roe_history_annual_3yr else 0
+        
+        show_srim_result("1. 최근 3년 실적 평균 기준 (연간)", bps_annual, avg_roe_annual, "3년 평균", roe_history_annual_3yr)
+    
+    st.divider()
+
+    if quarter_list:
+        bps_quarter = quarter_list[-1].get('bps', 0)
+        roe_history_quarter = []
+        for d in quarter_list:
+            if d.get('roe'): roe_history_quarter.append({'분기': d['date'], 'ROE': d['roe']})
+        
+        roe_history_quarter_3q = roe_history_quarter[-3:]
+        avg_roe_quarter = sum([r['ROE'] for r in roe_history_quarter_3q]) / len(roe_history_quarter_3q) if roe_history_quarter_3q else 0
+        
+        show_srim_result("2. 최근 3분기 실적 평균 기준 (분기)", bps_quarter, avg_roe_quarter, "3분기 평균", roe_history_quarter_3q)
+
+# st.fragment 를 지원하는 버전이면 민감도 표의 위젯 조작은 해당 부분만 다시 실행된다.
+@_fragment
+def render_srim_sensitivity(inputs, curr_price, required_return):
+    st.divider()
+    st.markdown("### 🧭 S-RIM 민감도 분석")
+    c1, c2 = st.columns([3, 2])
+    with c1: lo, hi = st.slider("요구수익률 범위 (%)", 3.0, 15.0, (5.0, 12.0), SENSITIVITY_RATE_STEP, key="srim_sens_range")
+    with c2: view = st.radio("표시", ["적정주가", "괴리율"], horizontal=True, key="srim_sens_view")
+    rates = np.round(np.arange(lo, hi + SENSITIVITY_RATE_STEP / 2, SENSITIVITY_RATE_STEP), 2)
+    fair, roes = srim_sensitivity(inputs, rates)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gap = (curr_price - fair) / fair * 100 if curr_price > 0 else fair * np.nan
+
+    head = "".join(
+        f'<th style="{"outline: 2px solid #03C75A;" if abs(r - required_return) < 1e-9 else ""}">{r:g}%</th>' for r in rates)
+    body = ""
+    for i, label in enumerate(fair.index):
+        cells = ""
+        for j in range(len(rates)):
+            f, g = fair.iat[i, j], gap.iat[i, j]
+            if pd.isna(f):
+                cells += "<td>-</td>"
+                continue
+            # 저평가(괴리율<0)는 초록, 고평가는 빨강. 괴리율이 클수록 진하게.
+            tint = "" if pd.isna(g) else f"background-color: rgba({'3,199,90' if g < 0 else '210,0,0'}, {min(abs(g), 100) / 250 + 0.05:.2f});"
+            text = f"{f:,.0f}" if view == "적정주가" else ("-" if pd.isna(g) else f"{g:+.1f}%")
+            cells += f'<td style="{tint}">{text}</td>'
+        body += f"<tr><td>{label}<br><small>{roes[i]:.2f}%</small></td>{cells}</tr>"
+    st.markdown(f'<div class="scroll-table"><table><thead><tr><th>ROE 기준</th>{head}</tr></thead><tbody>{body}</tbody></table></div>', unsafe_allow_html=True)
+    st.caption(f"현재가 {curr_price:,.0f}원 기준 · 괴리율 = (현재가 - 적정주가) / 적정주가 · 초록 = 저평가, 빨강 = 고평가 · 테두리 = 사이드바 요구수익률")
+
+def render_screener(required_return):
+    st.markdown("### 🔎 S-RIM 스크리너")
+    listing = load_stock_listing()
+    if listing.empty:
+        st.warning("종목 목록을 불러올 수 없습니다.")
+        return
+
+    c1, c2, c3 = st.columns(3)
+    markets = sorted(listing['Market'].dropna().unique())
+    with c1: selected_markets = st.multiselect("시장", markets, default=[m for m in markets if m in ('KOSPI', 'KOSDAQ')])
+    with c2: min_marcap = st.number_input("최소 시가총액(억)", 0, 10000000, 0, 500)
+    with c3: max_count = st.number_input("최대 종목 수(시총순)", 1, len(listing), len(listing), 100)
+    rates_text = st.text_input("요구수익률(%) 목록 (쉼표로 구분)", f"{required_return:g}, 6, 10")
+    try: rates = sorted({float(r) for r in rates_text.split(',') if r.strip() and float(r) > 0})
+    except ValueError: rates = []
+    if not rates:
+        st.error("요구수익률을 올바르게 입력하세요. 예: 6, 8, 10")
+        return
+
+    universe = listing[listing['Market'].isin(selected_markets)]
+    if 'Marcap' in universe:
+        universe = universe[universe['Marcap'] >= min_marcap * 100000000].sort_values('Marcap', ascending=False)
+    universe = universe.head(int(max_count))
+    source = st.radio("데이터 출처", ["KRX 일괄 (빠름)", "네이버 재무 (3년 평균 ROE)"], horizontal=True,
+                      disabled=krx is None, index=0 if krx is not None else 1)
+    st.caption(f"대상 {len(universe):,}개 종목 · 네이버 요청은 초당 최대 {SCREENER_RATE}건 (캐시된 종목은 요청하지 않음)"
+               + (" · KRX 일괄은 최근 EPS/BPS 로 ROE 를 계산하고, 빠진 종목만 네이버에서 가져옴" if source.startswith("KRX") else ""))
+
+    if st.button("스크리닝 실행", type="primary", disabled=universe.empty):
+        progress = st.progress(0.0, text="재무 데이터 수집 중...")
+        started = time.time()
+        provider = fundamentals_provider(bulk=source.startswith("KRX"))
+        st.session_state.screener_requested = len(universe)
+        st.session_state.screener_inputs = provider.frame(
+            universe['Code'].tolist(),
+            lambda done, total: progress.progress(done / total, text=f"재무 데이터 수집 중... {done:,}/{total:,}"))
+        st.session_state.screener_elapsed = time.time() - started
+        progress.empty()
+
+    inputs = st.session_state.get('screener_inputs')
+    if inputs is None:
+        return
+    result = evaluate_screener(universe, inputs, rates)
+    failed = st.session_state.get('screener_requested', len(inputs)) - len(inputs)
+    st.caption(f"수집 {len(inputs):,}개 종목{f' (실패 {failed:,}개)' if failed else ''} · {st.session_state.get('screener_elapsed', 0):.0f}초 소요 · 괴리율 = (현재가 - 적정주가) / 적정주가 (음수면 저평가)")
+    if result.empty:
+        st.warning("조건에 맞는 결과가 없습니다.")
+        return
+
+    sort_cols = list(result.columns)
+    s1, s2, s3 = st.columns([3, 1, 1])
+    with s1: sort_by = st.selectbox("정렬 기준", sort_cols, index=sort_cols.index(f'괴리율({rates[0]:g}%)'))
+    with s2: ascending = st.checkbox("오름차순", True)
+    with s3: page_size = st.selectbox("페이지 크기", [25, 50, 100], index=1)
+    result = result.sort_values(sort_by, ascending=ascending, na_position='last')
+    pages = max(1, -(-len(result) // page_size))
+    page = st.number_input(f"페이지 (전체 {pages})", 1, pages, 1)
+    st.dataframe(result.iloc[(page - 1) * page_size: page * page_size], hide_index=True, use_container_width=True)
+
+def parse_ticker_list(text, search_index):
+    """쉼표/줄바꿈으로 구분한 종목명·코드·초성을 (코드, 이름) 목록으로. 각 항목의 최상위 검색 결과를 쓴다."""
+    picked = {}
+    for token in re.split(r'[,\n]', text):
+        token = token.strip()
+        if not token: continue
+        matches = search_index.search(token, 1)
+        if matches: picked.setdefault(matches[0][0], matches[0][1])
+        elif len(token) == 6 and token.isdigit(): picked.setdefault(token, token)
+    return list(picked.items())
+
+def render_comparison(required_return, search_index):
+    st.markdown("### ⚖️ 종목 비교")
+    text = st.text_area("비교할 종목 (쉼표 또는 줄바꿈으로 구분)", placeholder="삼성전자, SK하이닉스, 035420 ...", height=80)
+    picked = parse_ticker_list(text, search_index)
+    if len(picked) > COMPARE_MAX:
+        st.warning(f"최대 {COMPARE_MAX}개까지 비교할 수 있어 앞의 {COMPARE_MAX}개만 사용합니다.")
+        picked = picked[:COMPARE_MAX]
+    if not picked:
+        st.caption("종목을 입력하세요.")
+        return
+    names = dict(picked)
+    st.caption(" · ".join(f"{name}({code})" for code, name in picked))
+
+    # 모은 결과는 종목 조합별로 세션에 둔다. 요구수익률/지표/기간을 바꿀 때마다 30종목을 다시 받지 않는다.
+    key = tuple(names)
+    gathered = st.session_state.get('compare_rows')
+    refresh = st.button("🔄 다시 불러오기", key="compare_refresh")
+    if refresh or gathered is None or gathered['tickers'] != key:
+        progress = st.progress(0.0, text="데이터 수집 중...")
+        started = time.time()
+        rows, failed = gather_comparison(
+            list(names), lambda done, total: progress.progress(done / total, text=f"데이터 수집 중... {done}/{total}"))
+        progress.empty()
+        gathered = st.session_state.compare_rows = {
+            'tickers': key, 'rows': rows, 'failed': failed, 'elapsed': time.time() - started, 'at': datetime.now()}
+    # 입력 순서대로 맞춘다 (수집은 끝난 순서로 들어온다)
+    rows = {t: gathered['rows'][t] for t in names if t in gathered['rows']}
+    failed = gathered['failed']
+    st.caption(f"{len(rows)}개 종목 · {gathered['elapsed']:.1f}초 · {gathered['at']:%H:%M:%S} 기준"
+               + (f" · 실패: {', '.join(names[t] for t in failed)}" if failed else ""))
+    if not rows:
+        st.error("데이터를 불러오지 못했습니다.")
+        return
+
+    st.markdown("#### 시세")
+    st.dataframe(comparison_quotes(rows, names), use_container_width=True)
+
+    st.markdown(f"#### S-RIM (요구수익률 {required_return:g}%)")
+    srim = comparison_srim(rows, names, [required_return])
+    st.dataframe(srim, hide_index=True, use_container_width=True)
+
+    render_comparison_metric(rows, names)
+
+@_fragment
+def render_comparison_metric(rows, names):
+    """지표/기간을 바꾸면 이 표만 다시 그린다."""
+    st.markdown("#### 재무 비교")
+    c1, c2 = st.columns([1, 2])
+    with c1: period = st.radio("기간", ["연간 (최근 3년)", "분기 (최근 5분기)"], key="compare_period")
+    with c2: metric = st.selectbox("지표", list(FINANCIAL_LABELS), format_func=FINANCIAL_LABELS.get, key="compare_metric")
+    table = comparison_metric(rows, names, metric, quarterly=period.startswith("분기"))
+    if table.empty: st.info("해당 지표가 있는 종목이 없습니다.")
+    else: st.dataframe(table, use_container_width=True)
+
+def main():
+    st.set_page_config(page_title="주식 적정주가 분석기", page_icon="📈")
+    render_styles()
+    
+    with st.spinner('종목 데이터 로딩 중...'):
+        search_index = get_search_index()
+
+    with st.sidebar:
+        st.header("설정")
+        mode = st.radio("화면", ["종목 분석", "종목 비교", "S-RIM 스크리너"], horizontal=True)
+        required_return = st.number_input("요구수익률 (%)", 1.0, 20.0, 8.0, 0.5)
+
+    if mode == "S-RIM 스크리너":
+        render_screener(required_return)
+        return
+    if mode == "종목 비교":
+        render_comparison(required_return, search_index)
+        return
+
+    st.markdown("##### 종목 검색")
+    col_search, col_reset = st.columns([4, 1])
+    
+    ticker = None
+    with col_search:
+        if len(search_index):
+            query = st.text_input(
+                "종목명, 코드 또는 초성",
+                key=f"stock_query_{st.session_state.search_key}",
+                label_visibility="collapsed",
+                placeholder="종목명, 코드 또는 초성(예: ㅅㅅㅈㅈ) 입력 후 Enter"
+            )
+            if query:
+                matches = search_index.search(query)
+                if matches:
+                    labels = [f"{name} ({code})" for code, name in matches]
+                    picked = st.selectbox("검색 결과", range(len(labels)), format_func=labels.__getitem__,
+                                          key=f"stock_pick_{st.session_state.search_key}_{query}", label_visibility="collapsed")
+                    ticker = matches[picked][0]
+                elif len(query.strip()) == 6 and query.strip().isdigit():
+                    ticker = query.strip()
+                else:
+                    st.caption("검색 결과가 없습니다.")
+        else:
+            ticker_input = st.text_input("종목코드(6자리) 직접 입력")
+            if ticker_input and len(ticker_input) == 6 and ticker_input.isdigit():
+                ticker = ticker_input
+    
+    with col_reset:
+        if st.button("🔄 초기화"):
+            reset_search_state()
+            st.rerun()
+
+    if ticker:
+        get_prefetcher().record_view(ticker)
+        trace = RenderTrace(ticker)
+        trace_token = _current_trace.set(trace)
+        try:
+            labels = {'quote': "시세", 'chart': "차트", 'investor': "매매동향", 'flows': "수급 추이", 'financials': "재무제표", 'peers': "동일업종 비교", 'srim': "S-RIM"}
+            slots = {name: st.empty() for name in labels}
+            for name, label in labels.items():
+                with slots[name].container(): render_skeleton(label)
+            cache = get_ticker_cache()
+            futures = submit_ticker_loads(ticker)
+            results = {}
+            stale = {}  # 섹션 -> 이전 값의 저장 시각 (새 값이 오면 지운다)
+            cache_status = {}
+            rendered = set()
+
+            # 도착하는 순서대로 해당 자리만 다시 그린다. 재무표/S-RIM은 현재가가 필요하므로 시세와 재무가 모두 온 뒤에 그린다.
+            # 이전 값으로 먼저 그린 섹션은 새 값이 오면 같은 자리를 덮어쓴다.
+            def version(kind):
+                return cache_status.get(kind, {}).get('version')
+
+            def badge(*sections):
+                ages = [stale[s] for s in sections if s in stale]
+                if ages: render_stale_badge(min(ages))
+
+            def render_ready():
+                for section in ('quote', 'investor', 'peers'):
+                    key = (section, section in stale)
+                    if section not in results or key in rendered: continue
+                    rendered.add(key)
+                    with refill(slots[section]), span('render', section):
+                        badge(section)
+                        if section == 'quote':
+                            if results['quote'] is None: st.error("시세 정보를 불러오지 못했습니다.")
+                            else: render_stock_header(results['quote'], ticker)
+                        elif section == 'investor': render_investor_trend(results['investor'] or [], memo_key('investor', ticker, version('investor')))
+                        elif results['peers'] is not None: render_industry_comparison(results['peers'], memo_key('peers', ticker, version('peers')))
+                # 차트 선택 위젯은 한 번만 만든다. 시세 머리글 바로 아래에 붙는다.
+                if 'quote' in results and 'chart' in results and 'chart' not in rendered:
+                    rendered.add('chart')
+                    if results['quote'] is None: slots['chart'].empty()
+                    else:
+                        with refill(slots['chart']), span('render', 'chart'): render_stock_chart(ticker)
+                if 'flows' in results and 'flows' not in rendered:
+                    rendered.add('flows')
+                    if results['flows'] is None or results['flows'].empty: slots['flows'].empty()
+                    else:
+                        with refill(slots['flows']), span('render', 'flows'): render_investor_flows(results['flows'])
+                key = ('financials', 'quote' in stale or 'financials' in stale)
+                if 'quote' in results and 'financials' in results and key not in rendered:
+                    rendered.add(key)
+                    info = results['quote']
+                    curr_price, shares = (info.price_or_zero, info.shares or 0) if info else (0, 0)
+                    annual_df, quarter_df = results['financials'] or (pd.DataFrame(), pd.DataFrame())
+                    annual_priced = apply_price_ratios(annual_df, curr_price, shares)
+                    quarter_priced = apply_price_ratios(quarter_df, curr_price, shares)
+                    annual_list, quarter_list = financial_records(annual_priced), financial_records(quarter_priced)
+                    with refill(slots['financials']), span('render', 'financials'):
+                        badge('financials')
+                        render_financial_tables(annual_priced, quarter_priced,
+                                                memo_key('financials', ticker, version('financials'), version('quote')))
+                    with refill(slots['srim']), span('render', 'srim'):
+                        badge('quote', 'financials')
+                        render_srim(annual_list, quarter_list, curr_price, required_return)
+                        # 민감도 위젯은 한 번만 만들 수 있으므로 최신 값으로만 그린다.
+                        if not key[1]: render_srim_sensitivity(srim_inputs(annual_df, quarter_df), curr_price, required_return)
+
+            def collect(timeout):
+                for future in as_completed([f for f in futures if futures[f] not in results or futures[f] in stale], timeout=timeout):
+                    section = futures[future]
+                    try:
+                        value, status = future.result()
+                        cache_status.update(status)
+                    except Exception:
+                        note_failure(f'load.{section}')
+                        if section in stale: continue  # 이전 값을 그대로 둔다
+                        value = None
+                    stale.pop(section, None)
+                    results[section] = value
+                    render_ready()
+
+            started = time.time()
+            try:
+                collect(SECTION_SOFT_DEADLINE)
+            except FuturesTimeout:
+                for section in ('quote', 'financials', 'investor', 'peers'):
+                    if section in results: continue
+                    previous = load_stale(cache, ticker, section)
+                    if previous is None: continue
+                    count('stale.shown')
+                    results[section], stale[section] = previous
+                    cache_status[section] = {'hit': True, 'stale': True, 'age': time.time() - previous[1], 'version': previous[1]}
+                if 'chart' not in results and get_ohlcv_store().last_date(ticker):
+                    # 갱신을 기다리지 않고 저장된 일봉으로 먼저 그린다. 갱신은 백그라운드에서 끝나 다음 조작부터 보인다.
+                    count('stale.shown')
+                    results['chart'] = True
+                render_ready()
+                try:
+                    collect(max(0.0, PAGE_DEADLINE - (time.time() - started)))
+                except FuturesTimeout:
+                    # 마감 시간을 넘긴 요청은 백그라운드에서 계속 돌고 결과는 캐시에 남는다.
+                    for section in ('quote', 'investor', 'flows', 'peers', 'financials'):
+                        if section not in results:
+                            count('deadline.missed')
+                            slots[section].warning("응답이 늦어 이 항목을 표시하지 못했습니다. 잠시 후 다시 시도하세요.")
+                    if 'financials' not in results or 'quote' not in results:
+                        slots['srim'].empty()
+                    if 'chart' not in rendered:
+                        # 일봉이 아직 없으면 비워 두지 않고 네이버 차트 이미지로 대신한다 (render_stock_chart 의 대체 경로).
+                        rendered.add('chart')
+                        if results.get('quote', True) is None: slots['chart'].empty()
+                        else:
+                            with refill(slots['chart']), span('render', 'chart'): render_stock_chart(ticker)
+
+            render_cache_status(cache_status)
+
+        except Exception as e:
+            note_failure('render')
+            st.error(f"오류 발생: {e}")
+        finally:
+            _current_trace.reset(trace_token)
+            get_trace_aggregator().add(trace.finish())
+
+        if st.query_params.get("diag") == "1":
+            render_diagnostics(trace)
+
+# --- 명령행 도구 ---
+def read_html_fixture(path):
+    raw = Path(path).read_bytes()
+    for encoding in ('utf-8', 'cp949'):
+        try: return raw.decode(encoding)
+        except UnicodeDecodeError: pass
+    return raw.decode('utf-8', errors='replace')
+
+def extract_main_page(soup, ticker):
+    return extract_stock_details(soup, ticker), extract_financials(soup), extract_industry_comparison(soup)
+
+def cmd_bench_parse(args):
+    """저장된 main.naver HTML로 기존 파서(html.parser 전체)와 lxml 부분 파싱을 비교한다."""
+    paths = sorted(p for p in Path(args.fixtures).rglob("*.html") if "frgn" not in p.name)
+    if not paths:
+        print(f"{args.fixtures} 에 *.html 파일이 없습니다.")
+        return 1
+    if lxml_html is None:
+        print("lxml이 설치되어 있지 않습니다.")
+        return 1
+
+    modes = {
+        'html.parser': lambda html: BeautifulSoup(html, 'html.parser'),
+        'lxml': lambda html: parse_naver_main_html(html, partial=False),
+        'lxml-partial': lambda html: parse_naver_main_html(html, partial=True),
+    }
+    timings = {mode: [] for mode in modes}
+    mismatches = 0
+    for path in paths:
+        html = read_html_fixture(path)
+        code = re.search(r'(\d{6})', path.stem)
+        ticker = code.group(1) if code else path.stem
+        results = {}
+        for mode, parse in modes.items():
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = extract_main_page(parse(html), ticker)
+                samples.append(time.perf_counter() - start)
+            timings[mode].append(statistics.median(samples))
+            results[mode] = result
+
+        base_details, base_fin, base_peers = results['html.parser']
+        for mode in ['lxml', 'lxml-partial']:
+            details, fin, peers = results[mode]
+            if details != base_details or fin != base_fin or not peers.equals(base_peers):
+                mismatches += 1
+                print(f"[불일치] {path.name}: {mode} 결과가 html.parser 와 다릅니다.")
+
+    base = sum(timings['html.parser'])
+    print(f"파일 {len(paths)}개, 반복 {args.repeat}회 (중앙값 합계, 파싱+추출)")
+    for mode, samples in timings.items():
+        total = sum(samples)
+        print(f"  {mode:<13} {total * 1000:9.1f} ms  x{base / total if total else 0:5.2f}")
+    print("결과 일치" if mismatches == 0 else f"불일치 {mismatches}건")
+    return 0 if mismatches == 0 else 1
+
+def load_ticker_list(spec=None, market=None):
+    """종목코드 목록. spec 이 파일이면 공백/쉼표/줄바꿈으로 구분된 코드, 아니면 쉼표 구분 코드. 없으면 KRX 전체."""
+    if spec:
+        text = Path(spec).read_text(encoding='utf-8') if Path(spec).is_file() else spec
+        return [t for t in re.split(r'[\s,]+', text) if t]
+    listing = load_stock_listing()
+    if listing.empty: return []
+    if market: listing = listing[listing['Market'].isin(market)]
+    return listing['Code'].tolist()
+
+def use_fixtures(mode, path=None):
+    """명령행에서 녹화/재생 모드로 전환한다. 이미 만들어진 HTTP 클라이언트/목록 캐시는 버린다."""
+    os.environ["STOCK_APP_HTTP_MODE"] = mode
+    if path: os.environ["STOCK_APP_FIXTURE_DIR"] = str(path)
+    get_http_client.clear()
+    get_reference_data.clear()
+
+def cmd_record(args):
+    """종목별 main.naver / frgn.naver 응답과 KRX 종목 목록을 녹화한다."""
+    use_fixtures("record", args.fixtures)
+    listing = load_stock_listing()
+    tickers = load_ticker_list(args.tickers)
+    print(f"종목 목록 {len(listing):,}건 녹화, 종목 {len(tickers):,}개 녹화 시작 -> {fixture_dir()}")
+    failures = 0
+    for i, ticker in enumerate(tickers, 1):
+        for url in (NAVER_MAIN_URL.format(ticker=ticker), NAVER_FRGN_URL.format(ticker=ticker)):
+            try:
+                if http_get(url).status_code != 200: failures += 1
+            except Exception:
+                failures += 1
+        print(f"\r{i:,}/{len(tickers):,}", end="", flush=True)
+    print(f"\n완료 (실패 {failures}건)")
+    return 0 if failures == 0 else 1
+
+# 벤치마크 대상 스크래퍼와 '값이 비었는지' 판정. 마크업이 바뀌면 예외 없이 빈 값/'-'만 돌아오므로 따로 센다.
+BENCH_SCRAPERS = [
+    ('get_naver_stock_details', get_naver_stock_details,
+     lambda r: r.price is None and all(getattr(r, k) is None for k in ('market_cap', 'per', 'pbr', 'eps'))),
+    ('get_financials_from_naver', get_financials_from_naver, lambda r: not r[0] and not r[1]),
+    ('get_investor_trend', get_investor_trend, lambda r: not r),
+    ('get_same_industry_comparison', get_same_industry_comparison, lambda r: r.empty),
+]
+
+def recorded_tickers():
+    pages = (fixture_dir() / urlsplit(NAVER_MAIN_URL).hostname).glob("*main.naver*.html")
+    return sorted({m.group(1) for p in pages if (m := re.search(r'code=(\d{6})', p.name))})
+
+def cmd_bench(args):
+    """녹화된 응답으로 스크래퍼별 처리 시간, 메모리 할당, 초당 종목 수를 잰다 (네트워크 없음)."""
+    use_fixtures("replay", args.fixtures)
+    tickers = load_ticker_list(args.tickers) if args.tickers else recorded_tickers()
+    if not tickers:
+        print(f"{fixture_dir()} 에 녹화된 종목이 없습니다. 먼저 'record' 명령으로 녹화하세요.")
+        return 1
+
+    print(f"종목 {len(tickers)}개 × 반복 {args.repeat}회 ({fixture_dir()})")
+    print(f"{'함수':<30}{'중앙값(ms)':>11}{'p95(ms)':>10}{'최대할당(KiB)':>14}{'종목/초':>9}{'빈 결과':>8}")
+    blank_total = 0
+    for name, func, is_blank in BENCH_SCRAPERS:
+        samples = []
+        blanks = set()
+        for _ in range(args.repeat):
+            for ticker in tickers:
+                start = time.perf_counter()
+                result = func(ticker)
+                samples.append(time.perf_counter() - start)
+                if is_blank(result): blanks.add(ticker)
+
+        # 할당량은 tracemalloc 이 시간을 왜곡하므로 따로 한 번 더 돈다.
+        tracemalloc.start()
+        peaks = []
+        for ticker in tickers:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            func(ticker)
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+
+        samples.sort()
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f"{name:<30}{statistics.median(samples) * 1000:>11.2f}{p95 * 1000:>10.2f}"
+              f"{statistics.median(peaks) / 1024:>14.0f}{len(samples) / sum(samples):>9.1f}{len(blanks):>8}")
+        if blanks:
+            blank_total += len(blanks)
+            print(f"  빈 결과 종목: {', '.join(sorted(blanks)[:20])}{' ...' if len(blanks) > 20 else ''}")
+
+    # 실제 화면 경로: main.naver 1회 파싱 + 추출 3종 + 매매동향
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for ticker in tickers:
+            soup = fetch_naver_main(ticker)
+            extract_main_page(soup, ticker)
+            get_investor_trend(ticker)
+    elapsed = time.perf_counter() - start
+    print(f"{'종목 화면 전체':<30}{elapsed / (len(tickers) * args.repeat) * 1000:>11.2f}{'':>10}{'':>14}{len(tickers) * args.repeat / elapsed:>9.1f}")
+    return 1 if blank_total and args.strict else 0
+
+def cmd_refresh_store(args):
+    """저장소에서 오래된 종목만 골라 재무 스냅샷을 새로 받는다."""
+    tickers = load_ticker_list(args.tickers, args.market)
+    store = get_financial_store()
+    stale = store.stale_tickers(tickers)
+    print(f"전체 {len(tickers):,}개 중 갱신 대상 {len(stale):,}개")
+    started = time.time()
+    gather_srim_inputs(stale, lambda done, total: print(f"\r{done:,}/{total:,}", end="", flush=True))
+    still_stale = len(store.stale_tickers(stale))
+    print(f"\n완료: {time.time() - started:.0f}초, 실패 {still_stale:,}개")
+    return 0
+
+# --- 일괄 평가 (batch) ---
+# 화면 없이 여러 종목의 S-RIM 적정주가를 계산해 파일로 내보낸다. 한 종목이 끝날 때마다 바로 파일에 쓰므로
+# 중간에 멈춰도 --resume 으로 이미 쓴 종목을 건너뛰고 이어서 할 수 있다.
+BATCH_WINDOW = 4            # 작업자 1명당 미리 넣어 두는 종목 수 (나머지 목록은 메모리에 대기하지 않는다)
+BATCH_PARQUET_ROWS = 500    # Parquet 행 그룹 크기
+BATCH_TEXT_COLUMNS = {'ticker', 'name', 'fetched_at'}
+
+def batch_columns(rates):
+    columns = ['ticker', 'name', 'price', 'market_cap', 'per', 'pbr', 'eps', 'bps', 'dvr',
+               'roe_3y', 'bps_q', 'roe_3q', 'roe_latest']
+    for rate in rates:
+        columns += [f'fair_3y_{rate:g}', f'fair_3q_{rate:g}', f'gap_3y_{rate:g}']
+    return columns + ['fetched_at']
+
+def batch_valuation(store, limiter, rates, ticker):
+    """한 종목의 시세와 재무를 받아 S-RIM 결과 한 행(dict)을 만든다. 작업 스레드에서 돈다."""
+    limiter.acquire()
+    page = LazyNaverPage(ticker)
+    soup = page.get()
+    if soup is None:
+        raise LookupError("main.naver 응답 없음")
+    quote = extract_stock_details(soup, ticker)
+    inputs = srim_inputs(*load_financial_frames(ticker, page.get, store))
+    if quote.price is None and not inputs['bps']:
+        raise LookupError("시세/재무 정보 없음")
+
+    row = {'ticker': ticker, 'name': quote.name, 'price': quote.price, 'market_cap': quote.market_cap,
+           'per': quote.per, 'pbr': quote.pbr, 'eps': quote.eps, 'bps': inputs['bps'] or quote.bps, 'dvr': quote.dvr,
+           'roe_3y': inputs['roe_3y'], 'bps_q': inputs['bps_q'], 'roe_3q': inputs['roe_3q'],
+           'roe_latest': inputs['roe_latest']}
+    for rate in rates:
+        fair_3y = calculate_srim(inputs['bps'], inputs['roe_3y'], rate)
+        fair_3q = calculate_srim(inputs['bps_q'], inputs['roe_3q'], rate)
+        row[f'fair_3y_{rate:g}'] = round(fair_3y) if fair_3y > 0 else None
+        row[f'fair_3q_{rate:g}'] = round(fair_3q) if fair_3q > 0 else None
+        row[f'gap_3y_{rate:g}'] = (round((quote.price - fair_3y) / fair_3y * 100, 1)
+                                   if fair_3y > 0 and quote.price else None)
+    row['fetched_at'] = datetime.now().isoformat(timespec='seconds')
+    return row
+
+def drop_partial_line(path):
+    """중간에 끊겨 줄바꿈 없이 끝난 마지막 줄을 잘라낸다. 그 종목은 완료되지 않은 것으로 보고 다시 받는다."""
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = pos = f.tell()
+        while pos > 0:
+            step = min(4096, pos)
+            f.seek(pos - step)
+            chunk = f.read(step)
+            newline = chunk.rfind(b'\n')
+            if newline >= 0:
+                pos = pos - step + newline + 1
+                break
+            pos -= step
+        if pos < size: f.truncate(pos)
+
+def read_jsonl_rows(path, columns):
+    """이어하기할 JSONL 의 온전한 행들. 잘린 마지막 줄은 잘라내고, 첫 줄의 열 구성이 columns 와 다르면 ValueError."""
+    drop_partial_line(path)
+    rows = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try: rows.append(json.loads(line))
+            except ValueError: pass
+    if rows and list(rows[0]) != columns:
+        raise ValueError(f"{path} 의 열 구성이 이번 실행과 다릅니다 (요구수익률 확인).")
+    return rows
+
+class CsvBatchWriter:
+    """행마다 바로 flush 하는 CSV. 이어하기면 기존 파일 뒤에 붙인다."""
+
+    def __init__(self, path, columns, resume):
+        self.done = set()
+        if resume and path.exists(): drop_partial_line(path)
+        exists = resume and path.exists() and path.stat().st_size > 0
+        if exists:
+            with open(path, newline='', encoding='utf-8') as f:
+                reader = csv.DictReader(f)
+                if reader.fieldnames != columns:
+                    raise ValueError(f"{path} 의 열 구성이 이번 실행과 다릅니다 (요구수익률 확인).")
+                self.done = {row['ticker'] for row in reader}
+        self._file = open(path, 'a' if exists else 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=columns)
+        if not exists: self._writer.writeheader()
+
+    def write(self, row):
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class JsonlBatchWriter:
+    """한 줄에 한 종목. 중간에 끊겨 잘린 마지막 줄은 이어하기 때 잘라내고 그 종목을 다시 받는다."""
+
+    def __init__(self, path, columns, resume):
+        exists = resume and path.exists()
+        self.done = {row.get('ticker') for row in read_jsonl_rows(path, columns)} if exists else set()
+        self._file = open(path, 'a' if exists else 'w', encoding='utf-8')
+
+    def write(self, row):
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class ParquetBatchWriter:
+    """행 그룹 단위로 흘려 쓰는 Parquet. 파일 끝(footer)은 close 때 쓰이므로 임시 파일에 쓰고 마지막에 바꿔 넣는다.
+    close 전에 죽으면(SIGKILL, OOM) 임시 파일은 읽을 수 없으므로, 쓴 행은 옆의 <파일>.journal.jsonl 에도 바로 남긴다.
+    이어하기면 기존 파일의 행 그룹과 journal 의 행을 옮겨 담은 뒤 새 종목을 덧붙인다. 정상 종료하면 journal 은 지운다."""
+
+    def __init__(self, path, columns, resume):
+        if pq is None:
+            raise ValueError("Parquet 출력에는 pyarrow 가 필요합니다 (pip install pyarrow).")
+        self.path = path
+        self.schema = pa.schema([(c, pa.string() if c in BATCH_TEXT_COLUMNS else pa.float64()) for c in columns])
+        self._tmp = path.with_name(path.name + ".tmp")
+        self._journal_path = path.with_name(path.name + ".journal.jsonl")
+        self._rows = []
+        self.done = set()
+        existing = pq.ParquetFile(path) if resume and path.exists() else None
+        if existing is not None and not existing.schema_arrow.equals(self.schema):
+            raise ValueError(f"{path} 의 열 구성이 이번 실행과 다릅니다 (요구수익률 확인).")
+        journaled = read_jsonl_rows(self._journal_path, columns) if resume and self._journal_path.exists() else []
+        self._writer = pq.ParquetWriter(self._tmp, self.schema)
+        if existing is not None:
+            for batch in existing.iter_batches(batch_size=BATCH_PARQUET_ROWS):
+                self._writer.write_batch(batch)
+                self.done.update(batch.column('ticker').to_pylist())
+        # journal 에는 이전 실행이 쓴 행이 모두 남아 있다. 기존 파일에 이미 들어간 종목(바꿔 넣은 직후 죽은 경우)은 건너뛴다.
+        self._journal = open(self._journal_path, 'a' if journaled else 'w', encoding='utf-8')
+        for row in journaled:
+            if row.get('ticker') not in self.done: self._add(row)
+            self.done.add(row.get('ticker'))
+
+    def write(self, row):
+        self._journal.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        self._add(row)
+
+    def _add(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= BATCH_PARQUET_ROWS: self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._writer.write_table(pa.Table.from_pylist(self._rows, schema=self.schema))
+            self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+        self._journal.close()
+        os.replace(self._tmp, self.path)
+        self._journal_path.unlink()
+
+BATCH_WRITERS = {'.csv': CsvBatchWriter, '.jsonl': JsonlBatchWriter, '.parquet': ParquetBatchWriter}
+
+def cmd_batch(args):
+    """여러 종목의 적정주가를 제한된 동시성으로 계산해 CSV/JSONL/Parquet 로 흘려 쓴다."""
+    out = Path(args.out)
+    writer_cls = BATCH_WRITERS.get(out.suffix.lower())
+    if writer_cls is None:
+        print(f"지원하지 않는 출력 형식입니다: {out.suffix or '(확장자 없음)'} (.csv / .jsonl / .parquet)")
+        return 2
+    rates = args.required_return
+    if any(rate <= 0 for rate in rates):
+        print("요구수익률은 0보다 커야 합니다.")
+        return 2
+    tickers = list(dict.fromkeys(load_ticker_list(args.tickers, args.market)))
+    if not tickers:
+        print("평가할 종목이 없습니다.")
+        return 1
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    try: writer = writer_cls(out, batch_columns(rates), args.resume)
+    except ValueError as e:
+        print(e)
+        return 2
+    todo = [t for t in tickers if t not in writer.done]
+    skipped = len(tickers) - len(todo)
+    print(f"종목 {len(tickers):,}개 중 {len(todo):,}개 평가"
+          f"{f' (이어하기: {skipped:,}개 건너뜀)' if skipped else ''} -> {out} (작업자 {args.workers}명)")
+
+    store = get_financial_store()
+    limiter = RateLimiter(args.rate)
+    failures = {}
+    ok = 0
+    started = time.time()
+    interrupted = False
+    queue = iter(todo)
+    executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="batch")
+    pending = {}
+
+    def submit_next():
+        ticker = next(queue, None)
+        if ticker is not None:
+            pending[executor.submit(batch_valuation, store, limiter, rates, ticker)] = ticker
+
+    try:
+        for _ in range(args.workers * BATCH_WINDOW): submit_next()
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                ticker = pending.pop(future)
+                try:
+                    writer.write(future.result())
+                    ok += 1
+                except Exception as e:
+                    failures[ticker] = f"{type(e).__name__}: {e}"
+                submit_next()
+            done = ok + len(failures)
+            elapsed = time.time() - started
+            print(f"\r{done:,}/{len(todo):,}  성공 {ok:,}  실패 {len(failures):,}  {done / elapsed if elapsed else 0:.1f}종목/초",
+                  end="", flush=True)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\n중단합니다. 지금까지의 결과는 저장됩니다 (--resume 으로 이어하기).")
+    finally:
+        executor.shutdown(wait=not interrupted, cancel_futures=True)
+        writer.close()
+
+    elapsed = time.time() - started
+    done = ok + len(failures)
+    print(f"\n완료: {done:,}개 {elapsed:.1f}초 ({done / elapsed if elapsed else 0:.1f}종목/초), "
+          f"성공 {ok:,} · 실패 {len(failures):,} · 건너뜀 {skipped:,}")
+    if failures:
+        for reason, n in Counter(r.split(':')[0] for r in failures.values()).most_common():
+            print(f"  {reason}: {n:,}건")
+        sample = sorted(failures.items())[:20]
+        for ticker, reason in sample:
+            print(f"  {ticker}  {reason}")
+        if len(failures) > len(sample): print(f"  ... 외 {len(failures) - len(sample):,}건")
+    if interrupted: return 130
+    return 1 if failures else 0
+
+def build_cli_parser():
+    parser = argparse.ArgumentParser(prog="stock_app", description="주식 적정주가 분석기 명령행 도구")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("bench-parse", help="저장된 main.naver HTML로 파서 속도/결과 비교")
+    p.add_argument("fixtures", help="main.naver HTML 파일 폴더 (파일명 = 종목코드.html)")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=cmd_bench_parse)
+
+    p = sub.add_parser("record", help="네이버 응답과 종목 목록을 녹화 (오프라인 재생/벤치마크용)")
+    p.add_argument("--tickers", required=True, help="종목코드 목록 파일 또는 쉼표 구분 코드")
+    p.add_argument("--fixtures", help="녹화 폴더 (기본: data/fixtures)")
+    p.set_defaults(func=cmd_record)
+
+    p = sub.add_parser("bench", help="녹화된 응답으로 스크래퍼 벤치마크 (네트워크 없음)")
+    p.add_argument("--tickers", help="종목코드 목록 파일 또는 쉼표 구분 코드 (기본: 녹화된 전체)")
+    p.add_argument("--fixtures", help="녹화 폴더 (기본: data/fixtures)")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--strict", action="store_true", help="빈 결과가 있으면 실패 코드로 종료")
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("refresh-store", help="오래된 종목의 재무 스냅샷만 갱신")
+    p.add_argument("--tickers", help="종목코드 목록 파일 또는 쉼표 구분 코드. 없으면 KRX 전체")
+    p.add_argument("--market", nargs="*", help="KRX 전체일 때 시장 필터 (예: KOSPI KOSDAQ)")
+    p.set_defaults(func=cmd_refresh_store)
+
+    p = sub.add_parser("batch", help="여러 종목의 S-RIM 적정주가를 계산해 파일로 내보내기")
+    p.add_argument("--tickers", help="종목코드 목록 파일 또는 쉼표 구분 코드. 없으면 KRX 전체")
+    p.add_argument("--market", nargs="*", help="KRX 전체일 때 시장 필터 (예: KOSPI KOSDAQ)")
+    p.add_argument("--out", required=True, help="결과 파일 (.csv / .jsonl / .parquet)")
+    p.add_argument("--required-return", type=float, nargs="+", default=[8.0], help="요구수익률(%%), 여러 개 가능")
+    p.add_argument("--workers", type=int, default=SCREENER_WORKERS)
+    p.add_argument("--rate", type=float, default=SCREENER_RATE, help="네이버 요청 초당 허용량")
+    p.add_argument("--resume", action="store_true", help="결과 파일에 이미 있는 종목은 건너뛰고 이어서 쓰기 (Parquet 은 <파일>.journal.jsonl 에 남은 행도 이어받는다)")
+    p.set_defaults(func=cmd_batch)
+    return parser
+
+CLI_COMMANDS = {"bench-parse", "record", "bench", "refresh-store", "batch"}
+
+def run_cli(argv):
+    args = build_cli_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        sys.exit(run_cli(sys.argv[1:]))
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 저장소/녹화 파일이 실제 data/ 폴더를 건드리지 않도록 stock_app 을 불러오기 전에 임시 폴더로 돌린다.
+os.environ.setdefault("STOCK_APP_DATA_DIR", tempfile.mkdtemp(prefix="stock_app_test_"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
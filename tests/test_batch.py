@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import stock_app
+
+COLUMNS = stock_app.batch_columns([8.0])
+
+def row(ticker):
+    return {column: None for column in COLUMNS} | {'ticker': ticker, 'name': ticker, 'price': 1000.0}
+
+def test_jsonl_resume_drops_truncated_last_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text(json.dumps(row("005930")) + "\n" + '{"ticker": "111111", "na', encoding='utf-8')
+
+    writer = stock_app.JsonlBatchWriter(path, COLUMNS, resume=True)
+    assert writer.done == {"005930"}
+    writer.write(row("000660"))
+    writer.close()
+
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['ticker'] for line in lines] == ["005930", "000660"]
+
+def test_csv_resume_drops_truncated_last_line(tmp_path):
+    path = tmp_path / "out.csv"
+    writer = stock_app.CsvBatchWriter(path, COLUMNS, resume=False)
+    writer.write(row("005930"))
+    writer.close()
+    with open(path, 'a', encoding='utf-8') as f: f.write("111111,부분")
+
+    writer = stock_app.CsvBatchWriter(path, COLUMNS, resume=True)
+    assert writer.done == {"005930"}
+    writer.write(row("000660"))
+    writer.close()
+
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert [line.split(',')[0] for line in lines] == ["ticker", "005930", "000660"]
+
+def test_csv_resume_with_partial_header_starts_over(tmp_path):
+    path = tmp_path / "out.csv"
+    path.write_text("ticker,na", encoding='utf-8')
+
+    writer = stock_app.CsvBatchWriter(path, COLUMNS, resume=True)
+    assert writer.done == set()
+    writer.write(row("005930"))
+    writer.close()
+
+    assert path.read_text(encoding='utf-8').splitlines()[0] == ",".join(COLUMNS)
+
+def test_jsonl_resume_rejects_other_columns(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text(json.dumps(row("005930")) + "\n", encoding='utf-8')
+
+    with pytest.raises(ValueError):
+        stock_app.JsonlBatchWriter(path, stock_app.batch_columns([8.0, 10.0]), resume=True)
+
+def test_parquet_resume_keeps_rows_of_killed_run(tmp_path):
+    if stock_app.pq is None: pytest.skip("pyarrow 가 없습니다")
+    path = tmp_path / "out.parquet"
+    writer = stock_app.ParquetBatchWriter(path, COLUMNS, resume=False)
+    writer.write(row("005930"))
+    writer.close()
+    writer = stock_app.ParquetBatchWriter(path, COLUMNS, resume=True)
+    writer.write(row("000660"))
+    writer._journal.write('{"ticker": "111111", "na')  # close 없이 죽은 실행
+    writer._journal.flush()
+
+    writer = stock_app.ParquetBatchWriter(path, COLUMNS, resume=True)
+    assert writer.done == {"005930", "000660"}
+    writer.write(row("035420"))
+    writer.close()
+
+    assert stock_app.pq.read_table(path).column('ticker').to_pylist() == ["005930", "000660", "035420"]
+    assert not (tmp_path / "out.parquet.journal.jsonl").exists()
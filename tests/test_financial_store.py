@@ -0,0 +1,28 @@
+from bs4 import BeautifulSoup
+
+import stock_app
+
+def test_page_without_financials_backs_off(tmp_path):
+    store = stock_app.FinancialStore(tmp_path / "financials.sqlite3")
+    calls = []
+    def fetch_soup():
+        calls.append(1)
+        return BeautifulSoup("<html><body>ETF</body></html>", 'html.parser')
+
+    annual, quarter = stock_app.load_financial_frames("069500", fetch_soup, store)
+    assert annual.empty and quarter.empty
+    assert store.snapshot("069500")[1] is None
+    assert not store.is_stale("069500")
+
+    stock_app.load_financial_frames("069500", fetch_soup, store)
+    assert len(calls) == 1
+
+def test_failed_fetch_leaves_no_snapshot(tmp_path):
+    store = stock_app.FinancialStore(tmp_path / "financials.sqlite3")
+    def fetch_soup(): raise OSError("network down")
+
+    annual, quarter = stock_app.load_financial_frames("005930", fetch_soup, store)
+    assert annual.empty and quarter.empty
+    assert store.is_stale("005930")
+    assert stock_app.load_financial_frames("005930", lambda: None, store)[0].empty
+    assert store.is_stale("005930")
@@ -0,0 +1,88 @@
+from datetime import datetime
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pytest
+
+import stock_app
+
+PER_PAGE = stock_app.INVESTOR_ROWS_PER_PAGE
+ROW = ('<tr><td>{date}</td><td>70,000</td><td>100</td><td>+0.14%</td><td>1,000</td>'
+       '<td>+10</td><td>-20</td><td>5,000</td><td>55.00%</td></tr>')
+
+def business_days(n):
+    """오늘(주말이면 직전 금요일)부터 거꾸로 n 영업일, 'YYYY.MM.DD'"""
+    today = np.datetime64(datetime.now().date())
+    days = np.busday_offset(today, -np.arange(n), roll='backward')
+    return [str(d).replace('-', '.') for d in days]
+
+class FakeFrgn:
+    """frgn.naver 대역. history[skip:] 을 페이지당 PER_PAGE 행씩 돌려주고 요청한 페이지를 기록한다."""
+    def __init__(self, history, skip=0):
+        self.history, self.skip = history, skip
+        self.failing = set()
+        self.pages = []
+
+    def __call__(self, url, **kwargs):
+        page = int(parse_qs(urlsplit(url).query).get('page', ['1'])[0])
+        self.pages.append(page)
+        if page in self.failing:
+            return SimpleNamespace(status_code=503, text="")
+        days = self.history[self.skip:][(page - 1) * PER_PAGE:page * PER_PAGE]
+        rows = "".join(ROW.format(date=d) for d in days)
+        return SimpleNamespace(status_code=200, text=f'<table class="type2"></table><table class="type2">{rows}</table>')
+
+@pytest.fixture
+def store(tmp_path):
+    return stock_app.InvestorFlowStore(tmp_path / "investor.sqlite3")
+
+def load(frgn, store, monkeypatch, days=250):
+    frgn.pages.clear()
+    with store._connect() as conn:
+        conn.execute("UPDATE flow_checks SET checked_at = 0")
+    monkeypatch.setattr(stock_app, 'http_get', frgn)
+    return stock_app.load_investor_flows("005930", days, store)
+
+def test_head_fetches_only_pages_up_to_overlap(store, monkeypatch):
+    frgn = FakeFrgn(business_days(300), skip=25)
+    assert len(load(frgn, store, monkeypatch)) == 250
+    assert sorted(frgn.pages) == list(range(1, 14))
+
+    frgn.skip = 0
+    flows = load(frgn, store, monkeypatch)
+    assert sorted(frgn.pages) == [1, 2]
+    assert flows.index[-1].strftime('%Y.%m.%d') == frgn.history[0]
+    assert not store.history_ended("005930")
+
+    load(frgn, store, monkeypatch)
+    assert frgn.pages == [1]
+
+def test_tail_fetches_missing_past_pages(store, monkeypatch):
+    frgn = FakeFrgn(business_days(300))
+    assert len(load(frgn, store, monkeypatch, days=60)) == 60
+    assert sorted(frgn.pages) == [1, 2, 3]
+
+    assert len(load(frgn, store, monkeypatch)) == 250
+    assert sorted(frgn.pages) == [1] + list(range(4, 14))
+
+def test_short_page_ends_history(store, monkeypatch):
+    frgn = FakeFrgn(business_days(30))
+    assert len(load(frgn, store, monkeypatch)) == 30
+    assert store.history_ended("005930")
+
+    load(frgn, store, monkeypatch)
+    assert frgn.pages == [1]
+
+def test_failed_pages_do_not_end_history(store, monkeypatch):
+    frgn = FakeFrgn(business_days(300))
+    frgn.failing = set(range(1, 14))
+    assert load(frgn, store, monkeypatch).empty
+    assert not store.history_ended("005930")
+
+    frgn.failing = {1}
+    assert len(load(frgn, store, monkeypatch)) == 240
+    assert not store.history_ended("005930")
+
+    frgn.failing = set()
+    assert len(load(frgn, store, monkeypatch)) == 250
@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from bs4 import BeautifulSoup
+
+import stock_app
+
+FIXTURE = Path(__file__).parent / "fixtures" / "main_005930.html"
+FRGN_FIXTURE = Path(__file__).parent / "fixtures" / "replay" / "finance.naver.com" / "item_frgn.naver_code=005930.html"
+
+MODES = {
+    'html.parser': lambda html: BeautifulSoup(html, 'html.parser'),
+    'lxml': lambda html: stock_app.parse_naver_main_html(html, partial=False),
+    'lxml-partial': lambda html: stock_app.parse_naver_main_html(html, partial=True),
+}
+
+@pytest.fixture(scope="module")
+def results():
+    if stock_app.lxml_html is None: pytest.skip("lxml 이 없습니다")
+    html = stock_app.read_html_fixture(FIXTURE)
+    return {mode: stock_app.extract_main_page(parse(html), "005930") for mode, parse in MODES.items()}
+
+def test_fixture_is_extracted(results):
+    details, financials, peers = results['html.parser']
+    assert details.name == "삼성전자"
+    assert details.price == 71300
+    assert details.per == 13.2
+    assert financials[0] and financials[1]
+    assert not peers.empty
+
+@pytest.mark.parametrize("mode", ['lxml', 'lxml-partial'])
+def test_parsers_match_html_parser(results, mode):
+    base_details, base_financials, base_peers = results['html.parser']
+    details, financials, peers = results[mode]
+    assert details == base_details
+    assert financials == base_financials
+    pd.testing.assert_frame_equal(peers, base_peers)
+
+def test_investor_page_lxml_matches_html_parser():
+    if stock_app.lxml_html is None: pytest.skip("lxml 이 없습니다")
+    html = stock_app.read_html_fixture(FRGN_FIXTURE)
+    days = stock_app.parse_investor_page(html)
+    assert len(days) == stock_app.INVESTOR_ROWS_PER_PAGE
+    assert days == stock_app.parse_investor_page(html, use_lxml=False)
+
+@pytest.mark.parametrize("use_lxml", [True, False])
+def test_investor_page_keeps_missing_nets_as_none(use_lxml):
+    html = ('<table class="type2"></table><table class="type2">'
+            '<tr><td>2024.10.17</td><td>71,300</td><td>x</td><td>+1.71%</td><td>1</td><td></td><td>-5,000</td><td>1</td><td>55.10%</td></tr>'
+            '<tr><td>2024.10.16</td><td>70,100</td><td>x</td><td>-0.50%</td><td>1</td><td>+2,000</td><td>0</td><td>1</td><td>55.08%</td></tr>'
+            '</table>')
+    days = stock_app.parse_investor_page(html, use_lxml)
+    assert [(d.inst_net, d.frgn_net) for d in days] == [(None, -5000), (2000, 0)]
+
+    summary, _ = stock_app.investor_flow_stats(pd.DataFrame(
+        {'inst_net': [d.inst_net for d in reversed(days)], 'frgn_net': [d.frgn_net for d in reversed(days)]}, dtype=float))
+    assert summary.loc['기관', '5일 합계'] == 2000
+    assert summary.loc['기관', '연속(일)'] == 1
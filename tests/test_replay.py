@@ -0,0 +1,38 @@
+from pathlib import Path
+
+import pytest
+
+import stock_app
+
+REPLAY = Path(__file__).parent / "fixtures" / "replay"
+
+@pytest.fixture
+def replay_env(monkeypatch):
+    # use_fixtures 가 os.environ 을 바꾸므로 먼저 등록해 두면 테스트가 끝난 뒤 원래 값으로 돌아간다.
+    monkeypatch.setenv("STOCK_APP_HTTP_MODE", "live")
+    monkeypatch.setenv("STOCK_APP_FIXTURE_DIR", str(REPLAY))
+    yield
+    stock_app.get_http_client.clear()
+    stock_app.get_reference_data.clear()
+
+def test_bench_replays_recorded_fixtures(replay_env, capsys):
+    code = stock_app.run_cli(["bench", "--fixtures", str(REPLAY), "--repeat", "1", "--strict"])
+    out = capsys.readouterr().out
+
+    assert code == 0, out
+    assert "종목 1개" in out
+    for name, _, _ in stock_app.BENCH_SCRAPERS:
+        assert name in out
+    assert "빈 결과 종목" not in out
+
+def test_replay_serves_recorded_responses_without_network(replay_env, monkeypatch):
+    stock_app.use_fixtures("replay", REPLAY)
+    def no_network(*args, **kwargs):
+        raise AssertionError("재생 모드에서 네트워크 요청이 나갔습니다")
+    monkeypatch.setattr(stock_app.requests.Session, "get", no_network)
+
+    assert stock_app.recorded_tickers() == ["005930"]
+    assert stock_app.get_naver_stock_details("005930").name == "삼성전자"
+    assert len(stock_app.get_investor_trend("005930")) == 10
+    assert stock_app.fetch_naver_main("000000") is None  # 녹화되지 않은 응답은 404
+    assert stock_app.load_stock_listing()['Code'].tolist() == ["005930"]